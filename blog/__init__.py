@@ -4,7 +4,9 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 
 
-db = SQLAlchemy()
+from .database import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 migrate = Migrate()
 
@@ -18,6 +20,22 @@ def create_app():
     # create app; use instance folder for the database
     app = Flask(__name__, static_folder="static", instance_relative_config=True)
     os.makedirs(app.instance_path, exist_ok=True)
+    # APP_ENV=production: schema comes from `flask db upgrade` only, and
+    # workers warm up (templates, pool, search index) before serving
+    app.config['PRODUCTION'] = os.environ.get('APP_ENV') == 'production'
+    app.config['WARMUP'] = os.environ.get('WARMUP', '1' if app.config['PRODUCTION'] else '0') == '1'
+    # also build the search and author indexes during warm-up; boot time then
+    # grows with the corpus, so by default they are built on first use
+    app.config['WARMUP_INDEXES'] = os.environ.get('WARMUP_INDEXES', '0') == '1'
+    # Link static files to their fingerprinted copies from `flask assets build`
+    app.config['ASSET_MANIFEST'] = os.environ.get('ASSET_MANIFEST', '1' if app.config['PRODUCTION'] else '0') == '1'
+    # Compiled templates are cached on disk and shared by all workers;
+    # set JINJA_CACHE_DIR to an empty string to disable
+    cache_dir = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    if cache_dir:
+        from jinja2 import FileSystemBytecodeCache
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(cache_dir)}
     login_manager.init_app(app)
     app.config["SECRET_KEY"] = "dev-key"
     # Database configuration
@@ -34,27 +52,136 @@ def create_app():
     app.config['UPLOAD_FOLDER'] = "blog/static/uploads"
     app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # 2 MB limit
     # Mail settings (optional) - configure in production via env vars
-    app.config['MAIL_SERVER'] = 'localhost'
-    app.config['MAIL_PORT'] = 25
-    app.config['MAIL_DEFAULT_SENDER'] = 'noreply@bumfi.local'
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'localhost')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 25))
+    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '0') == '1'
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+    app.config['MAIL_TIMEOUT'] = int(os.environ.get('MAIL_TIMEOUT', 10))
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@bumfi.local')
+    # Site root for links in mail built by the job worker, e.g. https://bumfi.example;
+    # without it the root of the request that queued the mail is used
+    app.config['BASE_URL'] = os.environ.get('BASE_URL')
+    # Background jobs (see blog.jobs): attempts before a job is marked failed,
+    # base retry delay in seconds (doubling per attempt), and how long a
+    # running job may stay locked before another worker takes it over
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_RETRY_BACKOFF'] = float(os.environ.get('JOB_RETRY_BACKOFF', 10))
+    app.config['JOB_LOCK_TIMEOUT'] = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))
+    # Comment threads on a post page: top-level comments per page, reply
+    # levels rendered up front, and replies shown per comment before
+    # "Show more" fetches the rest (see blog.comments.load_comment_page)
+    app.config['COMMENT_PAGE_SIZE'] = 20
+    app.config['COMMENT_DEPTH'] = 3
+    app.config['COMMENT_REPLIES_PER_PARENT'] = 5
+    # Related posts stored per post by `flask related rebuild` and the job queue
+    app.config['RELATED_POSTS_K'] = int(os.environ.get('RELATED_POSTS_K', 5))
+    # Entries in /feed.atom, /feed.json and the per-user feeds
+    app.config['FEED_SIZE'] = int(os.environ.get('FEED_SIZE', 20))
+    # Show an approximate (cached) story count on the cursor-paginated feed
+    app.config['FEED_APPROX_TOTAL'] = os.environ.get('FEED_APPROX_TOTAL', '1') == '1'
+    # Per-endpoint Cache-Control for conditional GET responses (see blog.http_cache)
+    from .http_cache import DEFAULT_CACHE_CONTROL
+    app.config['CACHE_CONTROL'] = dict(DEFAULT_CACHE_CONTROL)
+    # Search result cache (per process)
+    app.config['SEARCH_CACHE_SIZE'] = int(os.environ.get('SEARCH_CACHE_SIZE', 512))
+    app.config['SEARCH_CACHE_TTL'] = int(os.environ.get('SEARCH_CACHE_TTL', 300))
+    # Password hashing: werkzeug method string, pool threads, and how many
+    # hashes may be queued (waiting at most PASSWORD_HASH_TIMEOUT seconds)
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 8))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 2))
+    # Logged-in user snapshots (per process)
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 4096))
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+    # Instrumentation: statements slower than SLOW_QUERY_MS are logged to
+    # "blog.slow_sql"; set METRICS_TOKEN to require a bearer token on /metrics
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 
-    db.init_app(app)
-    migrate.init_app(app, db)
+    # SQLite production profile (WAL, pragmas, periodic checkpoints); used
+    # for the instance database and any other file-backed SQLite URL
+    from .database import DEFAULT_SQLITE_PRAGMAS, is_sqlite_file, init_sqlite, init_replicas, server_engine_options
+    app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_SQLITE_PRAGMAS)
+    app.config['SQLITE_CHECKPOINT_INTERVAL'] = int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 60))
+
+    # Connection pool for MySQL/TiDB; TiDB drops idle connections, so recycle early
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 280))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    # Read replicas: seconds to skip a failed replica, and how long a client
+    # stays on the primary after a write (read-your-own-writes)
+    app.config['DB_REPLICA_RETRY_AFTER'] = int(os.environ.get('DB_REPLICA_RETRY_AFTER', 30))
+    app.config['DB_REPLICA_STICKY_SECONDS'] = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+
+    # SQLAlchemy accepts engine options via `SQLALCHEMY_ENGINE_OPTIONS`; they
+    # must be in place before db.init_app creates the engine
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if db_url and not db_url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(server_engine_options(app))
 
     # Optional TLS/SSL configuration for some DB drivers (e.g. PyMySQL)
     # Provide the path to a CA file via the DB_SSL_CA env var to enable TLS verification.
     ca = os.environ.get('DB_SSL_CA')
     if ca:
-        # SQLAlchemy accepts engine options via `SQLALCHEMY_ENGINE_OPTIONS`
-        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
         app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = {'ssl': {'ca': ca}}
 
+    db.init_app(app)
+    migrate.init_app(app, db)
+
+    if is_sqlite_file(app.config["SQLALCHEMY_DATABASE_URI"]):
+        with app.app_context():
+            init_sqlite(app, db.engine)
+
+    # Optional read replicas (comma separated URLs) for GET-only requests
+    replica_urls = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+    if replica_urls and db_url:
+        init_replicas(app, replica_urls)
+
+    from .utils import search_cache
+    search_cache.maxsize = app.config['SEARCH_CACHE_SIZE']
+    search_cache.ttl = app.config['SEARCH_CACHE_TTL']
+
+    from .passwords import passwords
+    passwords.init_app(app)
+
+    from .users import user_cache
+    user_cache.maxsize = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+
+    from .metrics import init_metrics
+    init_metrics(app)
+
     from .routes import main
     app.register_blueprint(main)
-    from blog import routes,models
+
+    from .assets import init_assets
+    init_assets(app)
+
+    from .commands import counters_cli, avatars_cli, queries_cli
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(avatars_cli)
+    app.cli.add_command(queries_cli)
+
+    from .bench import bench_cli
+    app.cli.add_command(bench_cli)
+
+    from .jobs import jobs_cli
+    app.cli.add_command(jobs_cli)
+
+    from .assets import assets_cli
+    app.cli.add_command(assets_cli)
+
+    from .related import related_cli
+    app.cli.add_command(related_cli)
+
+    from .transfer import data_cli
+    app.cli.add_command(data_cli)
     return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    from blog.models import User
-    return User.query.get(int(user_id))
\ No newline at end of file
+    from blog.users import load_user_snapshot
+    return load_user_snapshot(int(user_id))
\ No newline at end of file
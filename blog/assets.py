@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional; only .gz siblings are written without it
+    brotli = None
+
+assets_cli = AppGroup("assets", help="Build fingerprinted, precompressed static assets.")
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+SKIP_DIRS = {DIST, "uploads"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".xml", ".map"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# content-addressed uploads (see blog.images.store_upload) never change either
+_HASHED_UPLOAD = re.compile(r"^uploads/[0-9a-f]{32}(-\d+)?\.\w+$")
+
+
+def _fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _compress(path):
+    with open(path, "rb") as fh:
+        data = fh.read()
+    written = []
+    packed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(packed) < len(data):
+        with open(path + ".gz", "wb") as fh:
+            fh.write(packed)
+        written.append(".gz")
+    if brotli is not None:
+        packed = brotli.compress(data, quality=11)
+        if len(packed) < len(data):
+            with open(path + ".br", "wb") as fh:
+                fh.write(packed)
+            written.append(".br")
+    return written
+
+
+def build_assets(static_folder, clean=False):
+    """Copy static files to `dist/` under content-hashed names.
+
+    Text assets also get `.gz` (and `.br` with the brotli package) siblings.
+    Writes `dist/manifest.json` mapping each source name to its hashed one
+    and returns that mapping. Old builds are kept unless `clean` is set, so
+    pages rendered before a deploy can still load their assets.
+    """
+    dist = os.path.join(static_folder, DIST)
+    if clean and os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == ".":
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            source = os.path.join(root, name)
+            rel = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, "/")
+            stem, ext = os.path.splitext(rel)
+            hashed = f"{DIST}/{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(static_folder, hashed)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                if ext.lower() in COMPRESSIBLE:
+                    _compress(target)
+            manifest[rel] = hashed
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST + ".part"), "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(os.path.join(dist, MANIFEST + ".part"), os.path.join(dist, MANIFEST))
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def _accepted_encodings():
+    accepted = request.accept_encodings
+    return [(enc, suffix) for enc, suffix in (("br", ".br"), ("gzip", ".gz")) if accepted[enc]]
+
+
+def serve_static(filename):
+    """Static view: precompressed siblings when accepted, and far-future
+    caching for fingerprinted and content-addressed files."""
+    folder = current_app.static_folder
+    immutable = filename.startswith(DIST + "/") or _HASHED_UPLOAD.match(filename)
+    if not immutable:
+        return current_app.send_static_file(filename)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = None
+    for encoding, suffix in _accepted_encodings():
+        if os.path.isfile(os.path.join(folder, filename + suffix)):
+            response = send_from_directory(folder, filename + suffix, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    if response is None:
+        response = send_from_directory(folder, filename, mimetype=mimetype)
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_assets(app):
+    """Serve static files through `serve_static` and, if enabled, point
+    `url_for('static', ...)` at the fingerprinted copies in the manifest."""
+    app.view_functions["static"] = serve_static
+    if not app.config["ASSET_MANIFEST"]:
+        return
+    manifest = load_manifest(app.static_folder)
+
+    @app.url_defaults
+    def fingerprinted_static(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = manifest.get(values["filename"], values["filename"])
+
+
+@assets_cli.command("build")
+@click.option("--clean", is_flag=True, help="Remove earlier builds first.")
+def assets_build(clean):
+    """Fingerprint and precompress static assets into static/dist."""
+    manifest = build_assets(current_app.static_folder, clean=clean)
+    click.echo(f"Built {len(manifest)} assets into {os.path.join(current_app.static_folder, DIST)}"
+               + ("" if brotli else " (install brotli for .br files)"))
@@ -0,0 +1,209 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy import func, or_
+
+from .models import User
+from .utils import tokenize
+
+
+class Author:
+    """What author search needs to show a user, without a database row."""
+
+    __slots__ = ("id", "username", "full_name", "profile_image")
+
+    def __init__(self, id, username, full_name, profile_image):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.profile_image = profile_image
+
+    def to_dict(self):
+        return {"username": self.username, "full_name": self.full_name}
+
+
+class AuthorIndex:
+    """In-process prefix index over usernames and full names, plus bio terms.
+
+    Names are kept as one sorted list of `(lowercased key, user id)` pairs:
+    the username, the full name and each word of the full name, so "ali"
+    finds both "alice" and "Mary Alison". A prefix lookup is a bisect plus a
+    short forward walk. Bio text is tokenized into an exact-term map.
+
+    Like `SearchIndex` it is built lazily and each worker keeps its own copy,
+    updated by `add` when a user registers or edits their account and caught
+    up with other workers' writes through `stamp`.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._keys = []
+            self._authors = {}
+            # user id -> (name keys, bio terms) so updates can undo an entry
+            self._entries = {}
+            self._bio_terms = {}
+            self._loaded = False
+            self.stamp = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __len__(self):
+        return len(self._authors)
+
+    def user_ids(self):
+        with self._lock:
+            return set(self._authors)
+
+    def load(self, users, stamp=None):
+        """Rebuild from an iterable of `(id, username, full_name, profile_image, bio)`."""
+        with self._lock:
+            self.clear()
+            keys = []
+            for user_id, username, full_name, profile_image, bio in users:
+                names, terms = self._index_entry(user_id, username, full_name, profile_image, bio)
+                keys.extend((key, user_id) for key in names)
+            keys.sort()
+            self._keys = keys
+            self._loaded = True
+            self.stamp = stamp
+
+    def add(self, user_id, username, full_name, profile_image, bio):
+        """Index (or re-index) one user."""
+        with self._lock:
+            self._remove(user_id)
+            names, terms = self._index_entry(user_id, username, full_name, profile_image, bio)
+            for key in names:
+                bisect.insort(self._keys, (key, user_id))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def _index_entry(self, user_id, username, full_name, profile_image, bio):
+        self._authors[user_id] = Author(user_id, username, full_name, profile_image)
+        names = {username.lower()}
+        if full_name:
+            names.add(full_name.lower())
+            names.update(word.lower() for word in full_name.split())
+        terms = set(tokenize(bio))
+        for term in terms:
+            self._bio_terms.setdefault(term, set()).add(user_id)
+        self._entries[user_id] = (names, terms)
+        return names, terms
+
+    def _remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        names, terms = entry
+        for key in names:
+            i = bisect.bisect_left(self._keys, (key, user_id))
+            if i < len(self._keys) and self._keys[i] == (key, user_id):
+                del self._keys[i]
+        for term in terms:
+            users = self._bio_terms.get(term)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._bio_terms[term]
+        del self._authors[user_id]
+
+    def prefix(self, q, limit=10):
+        """Authors whose username, full name or a name word starts with `q`.
+
+        Username matches come first, shortest first.
+        """
+        q = q.strip().lower()
+        if not q:
+            return []
+        with self._lock:
+            found = set()
+            i = bisect.bisect_left(self._keys, (q,))
+            while i < len(self._keys) and self._keys[i][0].startswith(q):
+                found.add(self._keys[i][1])
+                i += 1
+            authors = [self._authors[user_id] for user_id in found]
+        authors.sort(key=lambda a: (not a.username.lower().startswith(q), len(a.username), a.username))
+        return authors[:limit]
+
+    def search(self, q, limit=6):
+        """Name prefix matches for `q`, then authors whose bio has every term of `q`."""
+        with self._lock:
+            results = self.prefix(q, limit)
+            tokens = tokenize(q)
+            if len(results) < limit and tokens:
+                sets = [self._bio_terms.get(t, set()) for t in tokens]
+                seen = {a.id for a in results}
+                for user_id in sorted(set.intersection(*sets) - seen):
+                    results.append(self._authors[user_id])
+                    if len(results) == limit:
+                        break
+        return results
+
+
+author_index = AuthorIndex()
+
+
+_sync_lock = threading.Lock()
+
+# typeahead fires on every keystroke, so the stamp is checked at most this often
+SYNC_INTERVAL = 2.0
+_checked_at = [0.0]
+
+_COLUMNS = (User.id, User.username, User.full_name, User.profile_image, User.bio)
+
+
+def users_stamp(session):
+    """`(max id, count, latest date_updated)` of users; changes on register and profile edits."""
+    return tuple(session.query(func.max(User.id), func.count(User.id), func.max(User.date_updated)).one())
+
+
+def ensure_author_index(session):
+    """Build the author index, or catch it up with users written by other workers."""
+    now = time.monotonic()
+    if author_index.loaded and now - _checked_at[0] < SYNC_INTERVAL:
+        return
+    _checked_at[0] = now
+    stamp = users_stamp(session)
+    if author_index.loaded and author_index.stamp == stamp:
+        return
+
+    with _sync_lock:
+        if not author_index.loaded:
+            author_index.load(session.query(*_COLUMNS).yield_per(1000), stamp)
+        elif author_index.stamp != stamp:
+            _catch_up(session, stamp)
+
+
+def _catch_up(session, stamp):
+    last_id, _, last_updated = author_index.stamp or (None, None, None)
+    query = session.query(*_COLUMNS)
+    if last_id is not None:
+        # >= so edits committed later within the same timestamp aren't missed
+        edited = User.date_updated >= last_updated if last_updated else User.date_updated != None
+        query = query.filter(or_(User.id > last_id, edited))
+    for row in query.yield_per(1000):
+        author_index.add(*row)
+
+    if len(author_index) != stamp[1]:
+        existing = {user_id for user_id, in session.query(User.id)}
+        for user_id in author_index.user_ids() - existing:
+            author_index.remove(user_id)
+        missing = existing - author_index.user_ids()
+        if missing:
+            for row in session.query(*_COLUMNS).filter(User.id.in_(missing)):
+                author_index.add(*row)
+    author_index.stamp = stamp
+
+
+def index_author(user):
+    """Keep the author index in sync after `user` has been committed."""
+    if author_index.loaded:
+        author_index.add(user.id, user.username, user.full_name, user.profile_image, user.bio)
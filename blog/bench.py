@@ -0,0 +1,285 @@
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, func, insert, select
+
+from . import db
+from .counters import repair_counters
+from .models import Comment, CommentLike, Post, User, make_excerpt
+from .search import search_index
+from .utils import search_cache
+
+bench_cli = AppGroup("bench", help="Seed synthetic data and benchmark the main routes.")
+
+BENCH_PASSWORD = "bench-password"
+
+_COMMON = (
+    "the of and to in is that it for on with as was at by this be from or have an are not but "
+    "we you they all can will one more about out up what when there so if which their time"
+).split()
+_TOPICS = (
+    "python flask database index query cache latency design writing productivity startup "
+    "travel music garden coffee history science climate privacy security network browser "
+    "typography editor memory thread process compiler testing deploy kubernetes sqlite mysql"
+).split()
+
+
+def _words(rng, n):
+    # mostly filler with a skew towards a few topic words, like real posts
+    topic = rng.sample(_TOPICS, 3)
+    out = []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.15:
+            out.append(topic[int(rng.paretovariate(1.5)) % 3])
+        elif r < 0.25:
+            out.append(rng.choice(_TOPICS))
+        else:
+            out.append(rng.choice(_COMMON))
+    return out
+
+
+def _text(rng, n_words):
+    words = _words(rng, n_words)
+    sentences = []
+    while words:
+        size = rng.randint(6, 18)
+        chunk, words = words[:size], words[size:]
+        sentences.append(" ".join(chunk).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def _skewed(rng, items):
+    """Pick from `items` with a heavy head: the first 10% get ~45% of picks."""
+    return items[int(len(items) * rng.random() ** 3)]
+
+
+def _insert(model, rows, batch):
+    for i in range(0, len(rows), batch):
+        db.session.execute(insert(model), rows[i:i + batch])
+
+
+@bench_cli.command("seed")
+@click.option("--users", default=200, show_default=True)
+@click.option("--posts", default=2000, show_default=True)
+@click.option("--comments", default=20000, show_default=True)
+@click.option("--likes", default=50000, show_default=True)
+@click.option("--max-depth", default=8, show_default=True, help="Deepest reply level.")
+@click.option("--batch", default=1000, show_default=True, help="Rows per executemany.")
+@click.option("--seed", "random_seed", default=42, show_default=True)
+def bench_seed(users, posts, comments, likes, max_depth, batch, random_seed):
+    """Insert a synthetic corpus with batched inserts."""
+    rng = random.Random(random_seed)
+    started = time.perf_counter()
+    now = datetime.utcnow()
+
+    def next_id(model):
+        return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+    # one hash for every bench user; hashing each would dominate the run
+    user = User()
+    user.set_password(BENCH_PASSWORD)
+    first_user = next_id(User)
+    user_rows = [
+        dict(id=first_user + i, username=f"bench{first_user + i}", email=f"bench{first_user + i}@example.com",
+             password_hash=user.password_hash, full_name=" ".join(rng.sample(_TOPICS, 2)).title(),
+             bio=_text(rng, rng.randint(5, 40)))
+        for i in range(users)
+    ]
+    _insert(User, user_rows, batch)
+    user_ids = [u["id"] for u in user_rows]
+    rng.shuffle(user_ids)
+
+    first_post = next_id(Post)
+    post_rows = []
+    for i in range(posts):
+        content = _text(rng, rng.randint(80, 900))
+        created = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        post_rows.append(dict(
+            id=first_post + i, title=" ".join(_words(rng, rng.randint(3, 9))).capitalize(),
+            content=content, excerpt=make_excerpt(content), date_created=created, date_updated=created,
+            is_published=rng.random() < 0.9, user_id=_skewed(rng, user_ids)))
+    _insert(Post, post_rows, batch)
+    post_ids = [p["id"] for p in post_rows]
+    rng.shuffle(post_ids)
+
+    first_comment = next_id(Comment)
+    comment_rows = []
+    threads = {}  # post id -> [(comment id, depth, created)]
+    for i in range(comments):
+        post_id = _skewed(rng, post_ids)
+        thread = threads.setdefault(post_id, [])
+        parent_id, depth, created = None, 0, now - timedelta(days=rng.randint(0, 365))
+        if thread and rng.random() < 0.7:
+            # favour the latest comments so some threads grow deep
+            pid, pdepth, pcreated = thread[-1 - min(int(rng.expovariate(0.5)), len(thread) - 1)]
+            if pdepth < max_depth:
+                parent_id, depth, created = pid, pdepth + 1, pcreated + timedelta(minutes=rng.randint(1, 600))
+        comment_id = first_comment + i
+        thread.append((comment_id, depth, created))
+        comment_rows.append(dict(id=comment_id, content=_text(rng, rng.randint(3, 60)), date_created=created,
+                                 user_id=rng.choice(user_ids), post_id=post_id, parent_id=parent_id))
+    _insert(Comment, comment_rows, batch)
+    comment_ids = [c["id"] for c in comment_rows]
+    rng.shuffle(comment_ids)
+
+    pairs = set()
+    for _ in range(likes):
+        if comment_ids:
+            pairs.add((rng.choice(user_ids), _skewed(rng, comment_ids)))
+    _insert(CommentLike, [dict(user_id=u, comment_id=c) for u, c in pairs], batch)
+
+    db.session.commit()
+    repair_counters()
+    search_index.clear()
+    search_cache.clear()
+
+    total = len(user_rows) + len(post_rows) + len(comment_rows) + len(pairs)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Inserted {len(user_rows)} users, {len(post_rows)} posts, {len(comment_rows)} comments, "
+               f"{len(pairs)} likes in {elapsed:.1f}s ({total / elapsed:.0f} rows/s). "
+               f"Log in as bench{first_user} / {BENCH_PASSWORD}.")
+
+
+class _Probe:
+    """Counts SQL statements and ORM rows loaded while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.queries = 0
+        self.rows = 0
+
+    def _on_execute(self, *args):
+        self.queries += 1
+
+    def _on_load(self, target, context):
+        self.rows += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(db.Model, "load", self._on_load, propagate=True)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        event.remove(db.Model, "load", self._on_load)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def _summarize(samples):
+    latencies = [s[0] * 1000 for s in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s[3] >= 500),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p90_ms": round(_percentile(latencies, 90), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "max_ms": round(max(latencies), 3),
+        "queries_mean": round(statistics.fmean(s[1] for s in samples), 2),
+        "queries_max": max(s[1] for s in samples),
+        "rows_mean": round(statistics.fmean(s[2] for s in samples), 2),
+    }
+
+
+@bench_cli.command("run")
+@click.option("--requests", "n", default=50, show_default=True, help="Requests per route.")
+@click.option("--username", default=None, help="Bench user for authenticated routes (default: first bench user).")
+@click.option("--out", type=click.Path(dir_okay=False), default=None, help="Write results as JSON.")
+@click.option("--seed", "random_seed", default=7, show_default=True)
+def bench_run(n, username, out, random_seed):
+    """Drive each route through the test client and report latency, queries and rows."""
+    app = current_app._get_current_object()
+    app.config["WTF_CSRF_ENABLED"] = False
+    rng = random.Random(random_seed)
+
+    post_ids = db.session.execute(select(Post.id).where(Post.is_published == True)).scalars().all()
+    usernames = db.session.execute(select(User.username).join(Post, Post.user_id == User.id).distinct()).scalars().all()
+    comment_ids = db.session.execute(select(Comment.id)).scalars().all()
+    if not post_ids:
+        raise click.ClickException("No published posts; run `flask bench seed` first.")
+    username = username or db.session.execute(
+        select(User.username).where(User.username.like("bench%")).order_by(User.id)).scalar()
+    pages = max(len(post_ids) // 5, 1)
+
+    routes = {
+        "home": lambda: "/home",
+        "home_page": lambda: f"/home?page={rng.randint(1, pages)}",
+        "search": lambda: f"/search?q={'+'.join(rng.sample(_TOPICS, 2))}",
+        "post_detail": lambda: f"/post/{_skewed(rng, post_ids)}",
+        "user_profile": lambda: f"/user/{rng.choice(usernames)}",
+    }
+
+    client = app.test_client()
+    if username:
+        client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+
+    results = {}
+    for name, make_url in routes.items():
+        samples = []
+        for _ in range(n):
+            url = make_url()
+            with _Probe(db.engine) as probe:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            samples.append((elapsed, probe.queries, probe.rows, response.status_code))
+        results[name] = _summarize(samples)
+
+    if username and comment_ids:
+        samples = []
+        for _ in range(n):
+            comment_id = _skewed(rng, comment_ids)
+            with _Probe(db.engine) as probe:
+                started = time.perf_counter()
+                response = client.post(f"/comment/{comment_id}/like", headers={"Accept": "application/json"})
+                elapsed = time.perf_counter() - started
+            samples.append((elapsed, probe.queries, probe.rows, response.status_code))
+        results["like_toggle"] = _summarize(samples)
+
+    report = {
+        "created": datetime.utcnow().isoformat(timespec="seconds"),
+        "database": db.engine.url.render_as_string(hide_password=True),
+        "requests_per_route": n,
+        "routes": results,
+    }
+
+    click.echo(f"{'route':<14}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'queries':>9}{'rows':>9}{'errors':>8}")
+    for name, r in results.items():
+        click.echo(f"{name:<14}{r['p50_ms']:>9.2f}{r['p90_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+                   f"{r['queries_mean']:>9.1f}{r['rows_mean']:>9.1f}{r['errors']:>8}")
+    if out:
+        with open(out, "w") as fh:
+            json.dump(report, fh, indent=2)
+        click.echo(f"Wrote {out}")
+
+
+@bench_cli.command("compare")
+@click.argument("before", type=click.File())
+@click.argument("after", type=click.File())
+def bench_compare(before, after):
+    """Compare two `bench run --out` result files."""
+    old, new = json.load(before)["routes"], json.load(after)["routes"]
+
+    def change(a, b):
+        return f"{(b - a) / a * 100:+.0f}%" if a else "n/a"
+
+    click.echo(f"{'route':<14}{'p50 ms':>18}{'p99 ms':>18}{'queries':>16}")
+    for name in new:
+        if name not in old:
+            continue
+        o, n = old[name], new[name]
+        click.echo(f"{name:<14}"
+                   f"{o['p50_ms']:>7.2f}→{n['p50_ms']:<6.2f}{change(o['p50_ms'], n['p50_ms']):>5}"
+                   f"{o['p99_ms']:>7.2f}→{n['p99_ms']:<6.2f}{change(o['p99_ms'], n['p99_ms']):>5}"
+                   f"{o['queries_mean']:>6.1f}→{n['queries_mean']:<5.1f}{change(o['queries_mean'], n['queries_mean']):>5}")
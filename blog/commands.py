@@ -0,0 +1,81 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .counters import find_counter_drift, repair_counters
+from .images import AVATAR_SIZES, make_renditions
+from .query_plans import check_query_plans
+
+
+counters_cli = AppGroup("counters", help="Verify or repair the denormalized like/comment counters.")
+
+
+@counters_cli.command("verify")
+def counters_verify():
+    """Report counters that disagree with the underlying rows."""
+    posts, comments = find_counter_drift()
+    for post_id, stored, actual in posts:
+        click.echo(f"post {post_id}: comment_count={stored}, actual={actual}")
+    for comment_id, stored, actual in comments:
+        click.echo(f"comment {comment_id}: like_count={stored}, actual={actual}")
+
+    if posts or comments:
+        raise click.ClickException(
+            f"{len(posts)} post and {len(comments)} comment counters are out of date; "
+            "run `flask counters repair`."
+        )
+    click.echo("All counters are correct.")
+
+
+@counters_cli.command("repair")
+def counters_repair():
+    """Recompute all counters in bulk."""
+    posts, comments = repair_counters()
+    click.echo(f"Repaired {posts} post and {comments} comment counters.")
+
+
+avatars_cli = AppGroup("avatars", help="Manage uploaded avatar renditions.")
+
+
+@avatars_cli.command("rebuild")
+def avatars_rebuild():
+    """Generate missing renditions for every image in the upload folder."""
+    folder = current_app.config["UPLOAD_FOLDER"]
+    suffixes = tuple(f"-{size}.webp" for size in AVATAR_SIZES)
+    done = failed = 0
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(suffixes) or name.endswith(".part"):
+            continue
+        try:
+            make_renditions(name, folder)
+            done += 1
+        except OSError as exc:
+            failed += 1
+            click.echo(f"{name}: {exc}", err=True)
+    click.echo(f"Processed {done} images ({failed} failed).")
+
+
+queries_cli = AppGroup("queries", help="Inspect the queries behind the hot routes.")
+
+
+@queries_cli.command("explain")
+@click.option("--show", is_flag=True, help="Print every plan, not just regressions.")
+@click.option("--min-rows", default=0, help="MySQL/TiDB: ignore full scans estimated below this many rows.")
+def queries_explain(show, min_rows):
+    """Fail if a hot query's plan regresses to a full table scan."""
+    results = check_query_plans(current_app._get_current_object(), min_rows=min_rows)
+    failures = 0
+    for name, sql, plan, scans in results:
+        if not (show or scans):
+            continue
+        click.echo(f"== {name}{'  FULL SCAN: ' + ', '.join(scans) if scans else ''}")
+        click.echo("   " + " ".join(sql.split()))
+        for row in plan:
+            click.echo(f"   {row}")
+        failures += bool(scans)
+
+    if failures:
+        raise click.ClickException(f"{failures} of {len(results)} queries read a whole table.")
+    click.echo(f"{len(results)} queries checked, no full table scans.")
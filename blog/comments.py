@@ -0,0 +1,112 @@
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import aliased, joinedload
+
+from . import db
+from .models import Comment, CommentLike
+
+
+class CommentNode:
+    """A comment plus its already-loaded replies.
+
+    Attribute access falls through to the wrapped `Comment`, so templates can
+    keep using `comment.author`, `comment.likes_count` etc. while `replies`
+    comes from memory instead of a lazy load. `replies` may be a prefix of
+    all `reply_count` replies; `liked` says whether the viewing user has
+    liked it.
+    """
+
+    __slots__ = ("comment", "replies", "reply_count", "liked")
+
+    def __init__(self, comment):
+        self.comment = comment
+        self.replies = []
+        self.reply_count = 0
+        self.liked = False
+
+    def __getattr__(self, name):
+        return getattr(self.comment, name)
+
+    def to_dict(self):
+        c = self.comment
+        return {
+            "id": c.id,
+            "parent_id": c.parent_id,
+            "author": c.author.username,
+            "content": c.content,
+            "date_created": c.date_created.isoformat() if c.date_created else None,
+            "like_count": c.like_count,
+            "liked": self.liked,
+            "reply_count": self.reply_count,
+            "replies": [r.to_dict() for r in self.replies],
+        }
+
+
+def _top_level(post_id):
+    # top-level comments, and replies whose parent no longer exists
+    parent = aliased(Comment)
+    return (Comment.post_id == post_id) & (
+        Comment.parent_id.is_(None) | ~exists().where(parent.id == Comment.parent_id)
+    )
+
+
+def load_comment_page(post_id=None, parent_id=None, offset=0, limit=20, depth=3, per_parent=5, user_id=None):
+    """Load one page of comments with a bounded slice of their reply threads.
+
+    The page is the top-level comments of `post_id`, or the replies of
+    `parent_id`. Below it, at most `depth - 1` levels are loaded one level
+    per query, keeping the first `per_parent` replies of each comment via
+    ROW_NUMBER, so the cost is bounded however large the thread grows. Each
+    node gets its total `reply_count` so the rest can be fetched on demand.
+
+    Returns `(nodes, total)` where `total` counts the whole page's level.
+    """
+    where = Comment.parent_id == parent_id if parent_id is not None else _top_level(post_id)
+    total = db.session.execute(select(func.count(Comment.id)).where(where)).scalar()
+
+    comments = Comment.query \
+        .filter(where) \
+        .options(joinedload(Comment.author)) \
+        .order_by(Comment.date_created, Comment.id) \
+        .offset(offset).limit(limit) \
+        .all()
+    page = [CommentNode(c) for c in comments]
+    nodes = {n.id: n for n in page}
+
+    level = list(nodes)
+    for _ in range(depth - 1):
+        if not level:
+            break
+        rank = func.row_number().over(
+            partition_by=Comment.parent_id, order_by=(Comment.date_created, Comment.id)
+        ).label("rank")
+        ranked = select(Comment.id, rank).where(Comment.parent_id.in_(level)).subquery()
+        replies = Comment.query \
+            .join(ranked, ranked.c.id == Comment.id) \
+            .filter(ranked.c.rank <= per_parent) \
+            .options(joinedload(Comment.author)) \
+            .order_by(Comment.date_created, Comment.id) \
+            .all()
+        level = []
+        for c in replies:
+            node = nodes[c.id] = CommentNode(c)
+            nodes[c.parent_id].replies.append(node)
+            level.append(c.id)
+
+    if nodes:
+        counts = db.session.execute(
+            select(Comment.parent_id, func.count(Comment.id))
+            .where(Comment.parent_id.in_(list(nodes)))
+            .group_by(Comment.parent_id)
+        ).all()
+        for comment_id, count in counts:
+            nodes[comment_id].reply_count = count
+
+        if user_id is not None:
+            liked = db.session.execute(
+                select(CommentLike.comment_id)
+                .where(CommentLike.user_id == user_id, CommentLike.comment_id.in_(list(nodes)))
+            ).scalars()
+            for comment_id in liked:
+                nodes[comment_id].liked = True
+
+    return page, total
@@ -0,0 +1,117 @@
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from . import db
+from .models import Comment, CommentLike, Post
+
+
+def bump_comment_count(post_id, delta):
+    """Atomically adjust `Post.comment_count` inside the current transaction."""
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(comment_count=Post.comment_count + delta, activity=Post.activity + 1)
+    )
+
+
+def bump_like_count(comment_id, delta):
+    """Atomically adjust `Comment.like_count` (and its post's activity) inside the current transaction."""
+    db.session.execute(
+        update(Comment)
+        .where(Comment.id == comment_id)
+        .values(like_count=Comment.like_count + delta)
+    )
+    db.session.execute(
+        update(Post)
+        .where(Post.id == select(Comment.post_id).where(Comment.id == comment_id).scalar_subquery())
+        .values(activity=Post.activity + 1)
+    )
+
+
+def _insert_ignoring_duplicates(model, **values):
+    """INSERT that silently does nothing if a unique constraint would be violated."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite.insert(model).on_conflict_do_nothing()
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(model).on_conflict_do_nothing()
+    elif dialect == "mysql":
+        stmt = mysql.insert(model).prefix_with("IGNORE")
+    else:
+        stmt = insert(model)
+    return db.session.execute(stmt.values(**values)).rowcount
+
+
+def toggle_comment_like(user_id, comment_id):
+    """Like or unlike a comment and commit; returns `(liked, like_count)`.
+
+    Each step is a single statement guarded by `uix_user_comment`: the
+    DELETE removes an existing like, otherwise the INSERT adds one and is a
+    no-op if a concurrent request got there first. The counter only moves
+    when a row was actually deleted or inserted, so double clicks and
+    racing requests can't skew it. Returns None if the comment is gone.
+    """
+    removed = db.session.execute(
+        delete(CommentLike).where(CommentLike.user_id == user_id, CommentLike.comment_id == comment_id)
+    ).rowcount
+    if removed:
+        liked, delta = False, -removed
+    else:
+        liked, delta = True, _insert_ignoring_duplicates(CommentLike, user_id=user_id, comment_id=comment_id)
+
+    if delta:
+        bump_like_count(comment_id, delta)
+    like_count = db.session.execute(select(Comment.like_count).where(Comment.id == comment_id)).scalar()
+    if like_count is None:
+        db.session.rollback()
+        return None
+    db.session.commit()
+    return liked, like_count
+
+
+def _actual_comment_counts():
+    return select(func.count(Comment.id)) \
+        .where(Comment.post_id == Post.id) \
+        .scalar_subquery()
+
+
+def _actual_like_counts():
+    return select(func.count(CommentLike.id)) \
+        .where(CommentLike.comment_id == Comment.id) \
+        .scalar_subquery()
+
+
+def find_counter_drift():
+    """Return `(posts, comments)` lists of `(id, stored, actual)` that disagree."""
+    actual = _actual_comment_counts()
+    posts = db.session.execute(
+        select(Post.id, Post.comment_count, actual).where(Post.comment_count != actual)
+    ).all()
+
+    actual = _actual_like_counts()
+    comments = db.session.execute(
+        select(Comment.id, Comment.like_count, actual).where(Comment.like_count != actual)
+    ).all()
+
+    return posts, comments
+
+
+def repair_counters():
+    """Recompute every counter in two set-based UPDATEs and commit.
+
+    Returns the number of `(posts, comments)` rows touched.
+    """
+    actual = _actual_comment_counts()
+    posts = db.session.execute(
+        update(Post).where(Post.comment_count != actual).values(comment_count=actual),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+    actual = _actual_like_counts()
+    comments = db.session.execute(
+        update(Comment).where(Comment.like_count != actual).values(like_count=actual),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+    db.session.commit()
+    return posts, comments
@@ -0,0 +1,177 @@
+import itertools
+import time
+
+from flask import current_app, g, has_request_context, request, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+
+# Applied to every new SQLite connection; override via app.config['SQLITE_PRAGMAS'].
+# WAL lets readers proceed while a writer commits, and busy_timeout makes
+# writers wait for the lock instead of failing with "database is locked".
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -20000,  # KiB, i.e. ~20 MB of page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "wal_autocheckpoint": 1000,
+}
+
+
+def is_sqlite_file(url):
+    return url.startswith("sqlite:") and ":memory:" not in url and url.rstrip("/") != "sqlite:"
+
+
+def init_sqlite(app, engine):
+    """Apply the SQLite production profile to `engine`.
+
+    Sets the configured pragmas on every new connection and runs a passive
+    WAL checkpoint at most every `SQLITE_CHECKPOINT_INTERVAL` seconds when a
+    connection goes back to the pool, so the WAL file can't grow unbounded
+    while readers keep it pinned.
+    """
+    pragmas = app.config.get("SQLITE_PRAGMAS", DEFAULT_SQLITE_PRAGMAS)
+    interval = app.config.get("SQLITE_CHECKPOINT_INTERVAL", 60)
+    last_checkpoint = [time.monotonic()]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    if not interval:
+        return
+
+    @event.listens_for(engine, "checkin")
+    def checkpoint(dbapi_connection, connection_record):
+        now = time.monotonic()
+        if dbapi_connection is None or now - last_checkpoint[0] < interval:
+            return
+        last_checkpoint[0] = now
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        finally:
+            cursor.close()
+
+
+def server_engine_options(app):
+    """Pool settings for MySQL/TiDB; recycle connections before the server's
+    idle timeout and ping them on checkout so dropped ones are replaced."""
+    return {
+        "pool_size": app.config["DB_POOL_SIZE"],
+        "max_overflow": app.config["DB_MAX_OVERFLOW"],
+        "pool_pre_ping": True,
+        "pool_recycle": app.config["DB_POOL_RECYCLE"],
+        "pool_timeout": app.config["DB_POOL_TIMEOUT"],
+    }
+
+
+# Read-only endpoints whose GET/HEAD requests may read from a replica;
+# override via app.config['DB_REPLICA_ENDPOINTS']. Anything not listed
+# (e.g. the GET that deletes a comment) always reads from the primary.
+REPLICA_ENDPOINTS = frozenset({
+    "main.landing_page", "main.home", "main.search", "main.author_typeahead",
+    "main.user_profile", "main.post_detail", "main.post_comments", "main.comment_replies",
+    "main.feed_atom", "main.feed_json", "main.user_feed_atom", "main.user_feed_json",
+})
+
+
+class ReplicaSet:
+    """Round-robin over read-replica engines, skipping ones that recently failed."""
+
+    def __init__(self, engines, retry_after=30):
+        self.engines = engines
+        self.retry_after = retry_after
+        self._down_until = {}
+        self._counter = itertools.count()
+
+        for engine in engines:
+            event.listen(engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(context.engine)
+            if has_request_context() and g.get("_db_replica") is context.engine:
+                g._db_replica_failed = True
+
+    def mark_down(self, engine):
+        self._down_until[engine] = time.monotonic() + self.retry_after
+
+    def pick(self):
+        """Return the next healthy replica engine, or None if all are down."""
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._counter) % len(self.engines)]
+            if self._down_until.get(engine, 0) <= now:
+                return engine
+        return None
+
+
+def init_replicas(app, urls):
+    """Create engines for `urls` and route read-only requests to them."""
+    options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    engines = [create_engine(url, **options) for url in urls]
+    app.extensions["db_replicas"] = ReplicaSet(engines, app.config["DB_REPLICA_RETRY_AFTER"])
+    app.config.setdefault("DB_REPLICA_ENDPOINTS", REPLICA_ENDPOINTS)
+
+    @app.after_request
+    def stick_to_primary(response):
+        # read-your-own-writes: keep this client on the primary for a while
+        # after anything that may have written, whatever the method
+        if request.method not in ("GET", "HEAD", "OPTIONS") or g.get("_db_wrote"):
+            http_session["_primary_until"] = time.time() + app.config["DB_REPLICA_STICKY_SECONDS"]
+        return response
+
+
+class RoutingSession(Session):
+    """Session that sends reads from allow-listed GET/HEAD endpoints to a replica.
+
+    Writes, flushes, anything outside a request, the rest of a request once
+    it has written, and requests within the read-your-own-writes window
+    after a write all go to the primary.
+
+    A request uses one replica throughout, so its version tag and its body
+    come from the same snapshot. If that replica drops the connection, the
+    failed read is retried once on the primary and the rest of the request
+    stays there.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if has_request_context() and (self._flushing or (clause is not None and not clause.is_select)):
+            g._db_wrote = True
+        if bind is None and self._can_use_replica(clause):
+            if "_db_replica" not in g:
+                g._db_replica = current_app.extensions["db_replicas"].pick()
+            if g._db_replica is not None:
+                return g._db_replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+    def execute(self, statement, *args, **kwargs):
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except DBAPIError:
+            if not (has_request_context() and g.pop("_db_replica_failed", False)):
+                raise
+            # nothing was written (replicas only serve clean sessions), so
+            # dropping the transaction loses nothing
+            self.rollback()
+            g._db_replica = None
+            return super().execute(statement, *args, **kwargs)
+
+    def _can_use_replica(self, clause):
+        if not has_request_context() or "db_replicas" not in current_app.extensions:
+            return False
+        if request.method not in ("GET", "HEAD") or g.get("_db_wrote"):
+            return False
+        if request.endpoint not in current_app.config["DB_REPLICA_ENDPOINTS"]:
+            return False
+        if self._flushing or self.new or self.dirty or self.deleted:
+            return False
+        if clause is not None and not clause.is_select:
+            return False
+        return http_session.get("_primary_until", 0) < time.time()
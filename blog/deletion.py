@@ -0,0 +1,67 @@
+from sqlalchemy import delete, or_, select, update
+
+from . import db
+from .counters import bump_comment_count
+from .jobs import enqueue
+from .models import Comment, CommentLike, Post, RelatedPost
+
+# ids per IN (...) list, well under every backend's bound-parameter limit
+CHUNK = 500
+
+_BULK = {"synchronize_session": False}
+
+
+def comment_subtree_ids(comment_id):
+    """Ids of `comment_id` and all of its replies at any depth, from one recursive CTE."""
+    tree = select(Comment.id).where(Comment.id == comment_id).cte("subtree", recursive=True)
+    tree = tree.union_all(select(Comment.id).join(tree, Comment.parent_id == tree.c.id))
+    return db.session.execute(select(tree.c.id)).scalars().all()
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), CHUNK):
+        yield ids[i:i + CHUNK]
+
+
+def delete_comment_subtree(comment):
+    """Delete `comment`, its replies and all their likes in the current transaction.
+
+    Nothing is loaded into the session: the subtree ids come from one
+    query and the rows go in bulk DELETEs. Replies are detached from their
+    parents first, so the self-referencing foreign key never sees a parent
+    removed before its children. Returns the number of comments deleted.
+    """
+    ids = comment_subtree_ids(comment.id)
+    for chunk in _chunks(ids):
+        db.session.execute(delete(CommentLike).where(CommentLike.comment_id.in_(chunk)), execution_options=_BULK)
+        db.session.execute(update(Comment).where(Comment.id.in_(chunk)).values(parent_id=None),
+                           execution_options=_BULK)
+    for chunk in _chunks(ids):
+        db.session.execute(delete(Comment).where(Comment.id.in_(chunk)), execution_options=_BULK)
+    bump_comment_count(comment.post_id, -len(ids))
+    return len(ids)
+
+
+def delete_post(post_id):
+    """Delete a post with its comments, likes and related-post rows in a
+    handful of set-based statements, in the current transaction.
+
+    Posts that listed this one as related get recomputed in the background.
+    """
+    listed_by = db.session.execute(
+        select(RelatedPost.post_id).where(RelatedPost.related_id == post_id)
+    ).scalars().all()
+    db.session.execute(
+        delete(RelatedPost).where(or_(RelatedPost.post_id == post_id, RelatedPost.related_id == post_id)),
+        execution_options=_BULK,
+    )
+    if listed_by:
+        enqueue("related_posts", post_ids=listed_by)
+
+    post_comments = select(Comment.id).where(Comment.post_id == post_id)
+    db.session.execute(delete(CommentLike).where(CommentLike.comment_id.in_(post_comments)),
+                       execution_options=_BULK)
+    db.session.execute(update(Comment).where(Comment.post_id == post_id).values(parent_id=None),
+                       execution_options=_BULK)
+    db.session.execute(delete(Comment).where(Comment.post_id == post_id), execution_options=_BULK)
+    db.session.execute(delete(Post).where(Post.id == post_id), execution_options=_BULK)
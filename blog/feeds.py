@@ -0,0 +1,117 @@
+import hashlib
+import json
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from flask import Response, request, stream_with_context
+from sqlalchemy.orm import joinedload
+
+from .cache import TTLCache
+from .http_cache import cache_control_for
+from .models import Post, User
+
+# rendered feed bodies keyed on (kind, scope, version); a publish, edit or
+# delete changes the version, so stale bodies are simply never asked for
+feed_cache = TTLCache(maxsize=256, ttl=3600)
+
+MIMETYPES = {
+    "atom": "application/atom+xml; charset=utf-8",
+    "json": "application/feed+json; charset=utf-8",
+}
+
+
+def _iso(dt):
+    return dt.replace(microsecond=0).isoformat() + "Z" if dt else None
+
+
+def feed_posts(limit, user_id=None):
+    """Latest published posts with their authors, newest first."""
+    query = Post.query \
+        .options(joinedload(Post.author).load_only(User.username, User.full_name)) \
+        .filter(Post.is_published == True)
+    if user_id is not None:
+        query = query.filter(Post.user_id == user_id)
+    return query.order_by(Post.date_created.desc(), Post.id.desc()).limit(limit)
+
+
+def atom_chunks(posts, meta):
+    yield (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        f"<title>{escape(meta['title'])}</title>\n"
+        f"<id>{escape(meta['feed_url'])}</id>\n"
+        f"<link rel=\"self\" href={quoteattr(meta['feed_url'])}/>\n"
+        f"<link rel=\"alternate\" type=\"text/html\" href={quoteattr(meta['home_url'])}/>\n"
+        f"<updated>{_iso(meta['updated'] or datetime.utcnow())}</updated>\n"
+    )
+    for post in posts:
+        url = meta["post_url"](post)
+        author = post.author.full_name or post.author.username
+        yield (
+            "<entry>\n"
+            f"<title>{escape(post.title)}</title>\n"
+            f"<id>{escape(url)}</id>\n"
+            f"<link rel=\"alternate\" type=\"text/html\" href={quoteattr(url)}/>\n"
+            f"<published>{_iso(post.date_created)}</published>\n"
+            f"<updated>{_iso(post.date_updated or post.date_created)}</updated>\n"
+            f"<author><name>{escape(author)}</name></author>\n"
+            f"<summary>{escape(post.excerpt or '')}</summary>\n"
+            f"<content type=\"text\">{escape(post.content)}</content>\n"
+            "</entry>\n"
+        )
+    yield "</feed>\n"
+
+
+def json_chunks(posts, meta):
+    head = {
+        "version": "https://jsonfeed.org/version/1.1",
+        "title": meta["title"],
+        "home_page_url": meta["home_url"],
+        "feed_url": meta["feed_url"],
+    }
+    yield json.dumps(head, ensure_ascii=False)[:-1] + ', "items": ['
+    for i, post in enumerate(posts):
+        url = meta["post_url"](post)
+        item = {
+            "id": url,
+            "url": url,
+            "title": post.title,
+            "content_text": post.content,
+            "summary": post.excerpt,
+            "date_published": _iso(post.date_created),
+            "date_modified": _iso(post.date_updated or post.date_created),
+            "authors": [{"name": post.author.full_name or post.author.username, "url": meta["author_url"](post)}],
+        }
+        yield ("," if i else "") + json.dumps(item, ensure_ascii=False)
+    yield "]}\n"
+
+
+def _caching(chunks, key):
+    """Pass `chunks` through and cache the whole body once it completes."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    feed_cache.set(key, "".join(parts).encode("utf-8"))
+
+
+def feed_response(kind, scope, version, posts, meta):
+    """Serve a feed from cache, as 304 Not Modified, or streamed and cached.
+
+    `version` is the same cheap tag the HTML pages use; `posts` is a query
+    that is only run on a cache miss.
+    """
+    key = (kind, scope, repr(version))
+    etag = hashlib.sha1("\x1f".join(key).encode()).hexdigest()
+    headers = {"Cache-Control": cache_control_for(request.endpoint, False) or "no-cache"}
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        body = feed_cache.get(key)
+        if body is None:
+            chunks = atom_chunks if kind == "atom" else json_chunks
+            body = stream_with_context(_caching(chunks(posts.yield_per(50), meta), key))
+        response = Response(body, mimetype=MIMETYPES[kind], headers=headers)
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,79 @@
+import hashlib
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+# Cache-Control per endpoint and audience; overridable via app.config['CACHE_CONTROL']
+DEFAULT_CACHE_CONTROL = {
+    "default": {"anonymous": "no-cache", "authenticated": "private, no-cache"},
+    "main.home": {"anonymous": "public, max-age=60", "authenticated": "private, no-cache"},
+    "main.search": {"anonymous": "public, max-age=60", "authenticated": "private, no-cache"},
+    "main.user_profile": {"anonymous": "public, max-age=60", "authenticated": "private, no-cache"},
+    # feeds are the same for everyone and are revalidated with their ETag
+    "main.feed_atom": {"anonymous": "public, max-age=300", "authenticated": "public, max-age=300"},
+    "main.feed_json": {"anonymous": "public, max-age=300", "authenticated": "public, max-age=300"},
+    "main.user_feed_atom": {"anonymous": "public, max-age=300", "authenticated": "public, max-age=300"},
+    "main.user_feed_json": {"anonymous": "public, max-age=300", "authenticated": "public, max-age=300"},
+    # pages with forms embed a per-session CSRF token, so never share them
+    "main.post_detail": {"anonymous": "private, no-cache", "authenticated": "private, no-cache"},
+}
+
+
+def cache_control_for(endpoint, authenticated):
+    policies = current_app.config.get("CACHE_CONTROL") or DEFAULT_CACHE_CONTROL
+    policy = policies.get(endpoint) or policies.get("default") or {}
+    return policy.get("authenticated" if authenticated else "anonymous")
+
+
+def _etag(version, authenticated):
+    # The viewer is part of the tag because the navigation bar differs per
+    # user, and a time window keeps CSRF tokens in revalidated pages fresh.
+    window = current_app.config.get("WTF_CSRF_TIME_LIMIT") or 3600
+    parts = [
+        repr(version),
+        request.full_path,
+        current_user.get_id() if authenticated else "",
+        current_user.username if authenticated else "",
+        str(int(time.time() // (window / 2))),
+    ]
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+
+def conditional(version_func):
+    """Answer GET/HEAD with 304 Not Modified when the client copy is current.
+
+    `version_func` receives the view arguments and returns a cheap value
+    that changes whenever the page would, or None to skip conditional
+    handling. It runs before the view, so a matching request does no
+    template work at all. Only the ETag is used: no single timestamp moves
+    on every input to a page (new comments, likes, deletes, the viewer), so
+    no Last-Modified is sent and If-Modified-Since is ignored.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            # pending flash messages are rendered into the page
+            if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            version = version_func(*args, **kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+
+            authenticated = current_user.is_authenticated
+            etag = _etag(version, authenticated)
+
+            fresh = request.if_none_match.contains(etag)
+
+            response = make_response(("", 304) if fresh else view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                cache_control = cache_control_for(request.endpoint, authenticated)
+                if cache_control:
+                    response.headers["Cache-Control"] = cache_control
+                response.vary.add("Cookie")
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import tempfile
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# square avatar renditions generated for every upload, in pixels
+AVATAR_SIZES = (48, 128, 512)
+
+CHUNK_SIZE = 64 * 1024
+
+_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png"}
+
+# rendition file names already seen on disk, to skip the stat on hot pages
+_known_renditions = set()
+
+
+def store_upload(file_storage, folder):
+    """Stream an uploaded image to `folder`, named by its content hash.
+
+    Identical images end up as the same file, so re-uploading costs no
+    extra space. Returns the stored file name, or None if the upload is not
+    a JPEG/PNG image.
+    """
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+
+        try:
+            with Image.open(tmp_path) as img:
+                img.verify()
+                ext = _EXTENSIONS.get(img.format)
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            ext = None
+        if ext is None:
+            return None
+
+        name = f"{digest.hexdigest()[:32]}{ext}"
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            os.replace(tmp_path, path)
+        return name
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def rendition_name(name, size):
+    stem, _ = os.path.splitext(name)
+    return f"{stem}-{size}.webp"
+
+
+def make_renditions(name, folder, sizes=AVATAR_SIZES):
+    """Write square WebP renditions of the stored image `name`.
+
+    Existing renditions are left alone, so this is safe to re-run.
+    """
+    with Image.open(os.path.join(folder, name)) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        for size in sizes:
+            path = os.path.join(folder, rendition_name(name, size))
+            if os.path.exists(path):
+                continue
+            thumb = ImageOps.fit(img, (size, size), Image.LANCZOS)
+            thumb.save(path + ".part", "WEBP", quality=80, method=4)
+            os.replace(path + ".part", path)
+
+
+def avatar_url(name, size=48):
+    """URL of the smallest avatar rendition at least `size` pixels wide.
+
+    Falls back to the original upload when no rendition exists (yet).
+    """
+    if not name:
+        return None
+
+    best = next((s for s in AVATAR_SIZES if s >= size), AVATAR_SIZES[-1])
+    candidate = rendition_name(name, best)
+    if candidate not in _known_renditions:
+        folder = current_app.config.get("UPLOAD_FOLDER")
+        if folder and os.path.exists(os.path.join(folder, candidate)):
+            _known_renditions.add(candidate)
+        else:
+            candidate = name
+    return url_for("static", filename="uploads/" + candidate)
@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import and_, delete, func, or_, select, update
+
+from . import db
+from .models import Job
+
+log = logging.getLogger("blog.jobs")
+
+jobs_cli = AppGroup("jobs", help="Run and inspect background jobs.")
+
+_handlers = {}
+
+
+def handler(kind):
+    """Register the decorated function as the handler for jobs of `kind`."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, max_attempts=None, delay=0, **payload):
+    """Add a job to the session; it is queued when the caller commits.
+
+    Riding on the caller's transaction means a job never runs for a change
+    that was rolled back.
+    """
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        max_attempts=max_attempts or current_app.config["JOB_MAX_ATTEMPTS"],
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=current_app.config["JOB_LOCK_TIMEOUT"])
+    # running jobs whose worker died are picked up again after JOB_LOCK_TIMEOUT
+    return or_(
+        and_(Job.status == "queued", Job.run_at <= now),
+        and_(Job.status == "running", Job.locked_at < stale),
+    )
+
+
+def claim(worker_id):
+    """Lock the next due job for `worker_id`, or return None if there is none.
+
+    The conditional UPDATE only succeeds for one worker, so concurrent
+    workers never run the same job; losers simply try the next candidate.
+    """
+    for _ in range(5):
+        now = datetime.utcnow()
+        job_id = db.session.execute(
+            select(Job.id).where(_claimable(now)).order_by(Job.run_at, Job.id).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, _claimable(now))
+            .values(status="running", locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number `attempts`, with jitter."""
+    base = current_app.config["JOB_RETRY_BACKOFF"]
+    return min(base * 2 ** (attempts - 1), 3600) * random.uniform(0.8, 1.2)
+
+
+def run_job(job):
+    """Run a claimed job; delete it on success, reschedule or fail it on error."""
+    try:
+        func = _handlers[job.kind]
+        func(**json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        if job.attempts >= job.max_attempts:
+            status, run_at = "failed", job.run_at
+            log.error("job %s (%s) failed after %d attempts: %s", job.id, job.kind, job.attempts, e)
+        else:
+            status, run_at = "queued", datetime.utcnow() + timedelta(seconds=backoff(job.attempts))
+            log.warning("job %s (%s) attempt %d failed, retrying at %s: %s",
+                        job.id, job.kind, job.attempts, run_at, e)
+        db.session.execute(
+            update(Job).where(Job.id == job.id).values(
+                status=status, run_at=run_at, locked_by=None, locked_at=None,
+                last_error=traceback.format_exc()[-4000:])
+        )
+        db.session.commit()
+        return False
+
+    db.session.execute(delete(Job).where(Job.id == job.id))
+    db.session.commit()
+    return True
+
+
+def work(app, worker_id, stop, poll_interval=1.0, burst=False):
+    """Claim and run jobs until `stop` is set (or the queue is empty in burst mode)."""
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                job = claim(worker_id)
+            except Exception:
+                db.session.rollback()
+                log.exception("could not claim a job")
+                job = None
+            if job is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+                continue
+            run_job(job)
+            db.session.remove()
+
+
+@jobs_cli.command("work")
+@click.option("--concurrency", default=2, show_default=True, help="Worker threads.")
+@click.option("--poll", "poll_interval", default=1.0, show_default=True, help="Seconds between polls when idle.")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+def jobs_work(concurrency, poll_interval, burst):
+    """Run queued jobs."""
+    app = current_app._get_current_object()
+    stop = threading.Event()
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=work, args=(app, f"{base}:{i}", stop, poll_interval, burst), daemon=True)
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(0.5)
+    except KeyboardInterrupt:
+        click.echo("Stopping after the current jobs...")
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+@jobs_cli.command("status")
+def jobs_status():
+    """Show job counts by kind and status, and the latest failures."""
+    rows = db.session.execute(
+        select(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status).order_by(Job.kind, Job.status)
+    ).all()
+    if not rows:
+        click.echo("No jobs.")
+    for kind, status, count in rows:
+        click.echo(f"{kind:<24}{status:<10}{count:>8}")
+    for job in db.session.execute(
+        select(Job).where(Job.status == "failed").order_by(Job.id.desc()).limit(5)
+    ).scalars():
+        last_line = (job.last_error or "").strip().splitlines()[-1:] or [""]
+        click.echo(f"failed #{job.id} {job.kind}: {last_line[0]}")
+
+
+@jobs_cli.command("retry")
+def jobs_retry():
+    """Queue every failed job again."""
+    count = db.session.execute(
+        update(Job).where(Job.status == "failed").values(status="queued", attempts=0, run_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    click.echo(f"Requeued {count} jobs.")
+
+
+@jobs_cli.command("smtp-sink")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=1025, show_default=True)
+@click.option("--out", "outdir", default=None, help="Directory for .eml files (default: instance/mail).")
+def jobs_smtp_sink(host, port, outdir):
+    """Accept mail locally and write it to disk instead of delivering it.
+
+    Point the app at it with MAIL_SERVER=127.0.0.1 MAIL_PORT=1025.
+    """
+    from .mail import SinkServer
+    outdir = outdir or os.path.join(current_app.instance_path, "mail")
+    with SinkServer((host, port), outdir, echo=click.echo) as server:
+        click.echo(f"SMTP sink on {host}:{port}, writing to {outdir}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def external_url(base_url, endpoint, **values):
+    """Absolute URL for `endpoint` under `base_url`, without a request."""
+    parts = urlsplit(base_url)
+    adapter = current_app.url_map.bind(parts.netloc, script_name=parts.path or "/", url_scheme=parts.scheme)
+    return adapter.build(endpoint, values, force_external=True)
+
+
+@handler("reset_email")
+def send_reset_email_job(user_id, base_url=None, reset_url=None):
+    if base_url is None:
+        # queued before the worker signed tokens; only the site root is reused
+        base_url = reset_url.split("/reset_password/", 1)[0] + "/"
+    from .mail import send_mail
+    from .models import User
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    token = URLSafeTimedSerializer(current_app.config["SECRET_KEY"]).dumps({"user_id": user.id})
+    reset_url = external_url(base_url, "main.reset_token", token=token)
+    send_mail(
+        user.email,
+        "Password reset request",
+        f"To reset your password, visit the following link:\n\n{reset_url}\n\n"
+        "If you did not make this request, ignore this email. The link expires in one hour.\n",
+    )
+
+
+@handler("avatar_renditions")
+def avatar_renditions_job(name):
+    from .images import make_renditions
+    make_renditions(name, current_app.config["UPLOAD_FOLDER"])
+
+
+@handler("related_posts")
+def related_posts_job(post_ids):
+    from .related import update_related
+    update_related(post_ids, current_app.config["RELATED_POSTS_K"])
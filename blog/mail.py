@@ -0,0 +1,85 @@
+import os
+import smtplib
+import socketserver
+import time
+from email.message import EmailMessage
+
+from flask import current_app
+
+
+def send_mail(to, subject, body):
+    """Deliver a plain-text message through the configured MAIL_SERVER."""
+    config = current_app.config
+    msg = EmailMessage()
+    msg["From"] = config["MAIL_DEFAULT_SENDER"]
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg.set_content(body)
+
+    with smtplib.SMTP(config["MAIL_SERVER"], config["MAIL_PORT"], timeout=config["MAIL_TIMEOUT"]) as smtp:
+        if config["MAIL_USE_TLS"]:
+            smtp.starttls()
+        if config["MAIL_USERNAME"]:
+            smtp.login(config["MAIL_USERNAME"], config["MAIL_PASSWORD"])
+        smtp.send_message(msg)
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept a message and write it to `server.outdir`."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 bumfi smtp sink")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 hello")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 ok")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[-1].strip(" <>"))
+                self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                self.save(self.read_data(), recipients)
+                self.reply("250 queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                return b"".join(lines)
+            lines.append(line[1:] if line.startswith(b"..") else line)
+
+    def save(self, data, recipients):
+        name = os.path.join(self.server.outdir, f"{time.time_ns()}.eml")
+        with open(name, "wb") as fh:
+            fh.write(data)
+        self.server.echo(f"{', '.join(recipients)} -> {name}")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, outdir, echo=print):
+        self.outdir = outdir
+        self.echo = echo
+        os.makedirs(outdir, exist_ok=True)
+        super().__init__(address, SinkHandler)
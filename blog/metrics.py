@@ -0,0 +1,161 @@
+import bisect
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger("blog.slow_sql")
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Per-process histograms keyed by metric name and endpoint.
+
+    Each gunicorn worker keeps its own; the scraper sees whichever worker
+    answered, which is the usual trade-off for in-process Prometheus metrics.
+    """
+
+    METRICS = {
+        "bumfi_request_duration_seconds": ("Total time spent handling the request.", TIME_BUCKETS),
+        "bumfi_sql_duration_seconds": ("Time spent executing SQL per request.", TIME_BUCKETS),
+        "bumfi_sql_queries": ("SQL statements executed per request.", COUNT_BUCKETS),
+        "bumfi_render_duration_seconds": ("Time spent rendering templates per request.", TIME_BUCKETS),
+        "bumfi_hash_duration_seconds": ("Time spent hashing passwords per request.", TIME_BUCKETS),
+    }
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, endpoint, value):
+        with self._lock:
+            key = (name, endpoint)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(self.METRICS[name][1])
+            hist.observe(value)
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets) in self.METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, endpoint), hist in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    label = f'endpoint="{endpoint}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ("+Inf",), hist.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{label}}} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{{{label}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def record_timing(kind, seconds):
+    """Add `seconds` to the current request's `kind` timer, if instrumented."""
+    if has_request_context() and "_timings" in g:
+        g._timings[kind] = g._timings.get(kind, 0.0) + seconds
+
+
+def start_request():
+    g._timings = {}
+    g._sql_queries = 0
+    g._request_start = time.perf_counter()
+
+
+def finish_request(response):
+    if "_timings" not in g:
+        return response
+    total = time.perf_counter() - g._request_start
+    timings = g._timings
+    endpoint = request.endpoint or "unknown"
+
+    parts = [f'sql;dur={timings.get("sql", 0) * 1000:.1f};desc="{g._sql_queries} queries"']
+    parts.append(f'render;dur={timings.get("render", 0) * 1000:.1f}')
+    if "hash" in timings:
+        parts.append(f'hash;dur={timings["hash"] * 1000:.1f}')
+    parts.append(f"total;dur={total * 1000:.1f}")
+    response.headers["Server-Timing"] = ", ".join(parts)
+
+    metrics.observe("bumfi_request_duration_seconds", endpoint, total)
+    metrics.observe("bumfi_sql_duration_seconds", endpoint, timings.get("sql", 0.0))
+    metrics.observe("bumfi_sql_queries", endpoint, g._sql_queries)
+    metrics.observe("bumfi_render_duration_seconds", endpoint, timings.get("render", 0.0))
+    if "hash" in timings:
+        metrics.observe("bumfi_hash_duration_seconds", endpoint, timings["hash"])
+    return response
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the per-statement execution context, so a statement that
+    # raises leaves nothing behind on the pooled connection
+    context._metrics_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None or not has_request_context() or "_timings" not in g:
+        return
+    elapsed = time.perf_counter() - started
+    g._timings["sql"] = g._timings.get("sql", 0.0) + elapsed
+    g._sql_queries += 1
+
+    threshold = current_app.config.get("SLOW_QUERY_MS")
+    if threshold is not None and elapsed * 1000 >= threshold:
+        slow_query_log.warning("%.1f ms in %s: %s", elapsed * 1000, request.endpoint, " ".join(statement.split()))
+
+
+def _before_render(sender, template, context, **extra):
+    if "_timings" in g:
+        g.setdefault("_render_starts", []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    starts = g.get("_render_starts")
+    if starts:
+        elapsed = time.perf_counter() - starts.pop()
+        # only count the outermost render; nested renders are part of it
+        if not starts:
+            record_timing("render", elapsed)
+
+
+_engine_hooks_installed = False
+
+
+def init_metrics(app):
+    """Hook SQL execution and template rendering for every engine and template."""
+    global _engine_hooks_installed
+    from flask import before_render_template, template_rendered
+
+    if not _engine_hooks_installed:
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+        _engine_hooks_installed = True
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
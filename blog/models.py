@@ -2,8 +2,19 @@ from datetime import datetime
 from email.policy import default
 
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import defer, joinedload
 from blog import db
+from blog.passwords import passwords
+
+# list views show at most this many characters of a post
+EXCERPT_LENGTH = 300
+
+
+def make_excerpt(content):
+    content = content or ""
+    if len(content) > EXCERPT_LENGTH:
+        return content[:EXCERPT_LENGTH] + "..."
+    return content
 
 
 class User(UserMixin, db.Model):
@@ -17,26 +28,64 @@ class User(UserMixin, db.Model):
     website = db.Column(db.String(255), nullable=True)
     github = db.Column(db.String(255), nullable=True)
     twitter = db.Column(db.String(255), nullable=True)
+    # set on register and profile edits; other workers' author indexes catch up from it
+    date_updated = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_user_email", "email"),
+        db.Index("ix_user_date_updated", "date_updated"),
+    )
 
     # ONE relationship definition
     posts = db.relationship("Post", backref="author", lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
 
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # ✅ own PK
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # first EXCERPT_LENGTH characters of `content`, so list views can defer it
+    excerpt = db.Column(db.String(EXCERPT_LENGTH + 3), nullable=True)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    # set on create and by edit_post; not touched by counter updates
+    date_updated = db.Column(db.DateTime, default=datetime.utcnow)
     is_published = db.Column(db.Boolean, nullable=False, default=False)
+    # denormalized, kept in step by blog.counters
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # only ever goes up: bumped on every comment and like change, so the
+    # post page's version tag can't come back to an earlier value
+    activity = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     # ✅ foreign key points to user.id
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
+    __table_args__ = (
+        # home feed: published posts newest first, keyset on (date_created, id)
+        db.Index("ix_post_published_created", "is_published", "date_created", "id"),
+        # conditional GET version tags: max(date_updated) of published posts
+        db.Index("ix_post_published_updated", "is_published", "date_updated"),
+        # profile lists
+        db.Index("ix_post_user_created", "user_id", "date_created", "id"),
+    )
+
+    @db.validates("content")
+    def _sync_excerpt(self, key, value):
+        self.excerpt = make_excerpt(value)
+        return value
+
+    @classmethod
+    def list_query(cls):
+        """Query for list views: author joined in, full content deferred."""
+        return cls.query.options(
+            defer(cls.content),
+            joinedload(cls.author).load_only(User.username, User.profile_image),
+        )
+
     def __repr__(self):
         return f"<Post {self.title}>"
 
@@ -81,10 +130,18 @@ class Comment(db.Model):
 
     # likes relationship (users who liked this comment)
     likes = db.relationship('CommentLike', backref='comment', lazy='dynamic', cascade='all, delete-orphan')
+    # denormalized count of `likes`, kept in step by blog.counters
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # comment trees are loaded per post in date order
+        db.Index("ix_comment_post_created", "post_id", "date_created"),
+        db.Index("ix_comment_parent_id", "parent_id"),
+    )
 
     @property
     def likes_count(self):
-        return self.likes.count()
+        return self.like_count
 
 
 class CommentLike(db.Model):
@@ -94,4 +151,40 @@ class CommentLike(db.Model):
 
     user = db.relationship('User', backref=db.backref('comment_likes', lazy='dynamic'))
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'comment_id', name='uix_user_comment'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'comment_id', name='uix_user_comment'),
+        db.Index('ix_comment_like_comment_id', 'comment_id'),
+    )
+
+
+class RelatedPost(db.Model):
+    """Precomputed nearest neighbours of a post, best first (see blog.related)."""
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    related_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_related_post_related_id", "related_id"),
+    )
+
+
+class Job(db.Model):
+    """A unit of background work, claimed and run by `flask jobs work`."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    # queued -> running -> deleted on success, or back to queued with a
+    # later run_at on failure; failed once max_attempts is used up
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_job_status_run_at", "status", "run_at"),
+    )
@@ -0,0 +1,111 @@
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+
+from .cache import TTLCache
+from .models import Post
+
+# approximate totals for feeds, keyed on a caller supplied name
+_count_cache = TTLCache(maxsize=128, ttl=60)
+
+
+class KeysetPage:
+    """One page of a `(date_created, id)` keyset-paginated post list.
+
+    Cursors are opaque strings; pass `next_cursor` back as `after` and
+    `prev_cursor` as `before` to move through the list.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(post):
+    raw = f"{post.date_created.isoformat()}|{post.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(value):
+    """Return `(date_created, id)` for a cursor, or None if it is malformed."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        created, post_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_paginate(query, per_page, after=None, before=None, total=None):
+    """Paginate a `Post` query newest first without OFFSET.
+
+    `after` returns the page following that cursor, `before` the page
+    preceding it; with neither the first page is returned. Every page costs
+    one indexed range scan of `per_page + 1` rows, however deep it is.
+    """
+    after = decode_cursor(after)
+    before = None if after else decode_cursor(before)
+
+    if before:
+        created, post_id = before
+        rows = query.filter(or_(
+            Post.date_created > created,
+            and_(Post.date_created == created, Post.id > post_id),
+        )).order_by(Post.date_created.asc(), Post.id.asc()).limit(per_page + 1).all()
+
+        more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(
+            items,
+            next_cursor=encode_cursor(items[-1]) if items else None,
+            prev_cursor=encode_cursor(items[0]) if items and more else None,
+            total=total,
+        )
+
+    if after:
+        created, post_id = after
+        query = query.filter(or_(
+            Post.date_created < created,
+            and_(Post.date_created == created, Post.id < post_id),
+        ))
+
+    rows = query.order_by(Post.date_created.desc(), Post.id.desc()).limit(per_page + 1).all()
+    more = len(rows) > per_page
+    items = rows[:per_page]
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(items[-1]) if items and more else None,
+        prev_cursor=encode_cursor(items[0]) if items and after else None,
+        total=total,
+    )
+
+
+def forget_count(key):
+    """Drop a cached total so the next `approximate_count` recounts."""
+    _count_cache.pop(key)
+
+
+def approximate_count(key, query):
+    """Count rows of `query`, reusing the result for up to a minute."""
+    total = _count_cache.get(key)
+    if total is None:
+        total = query.with_entities(func.count(Post.id)).order_by(None).scalar()
+        _count_cache.set(key, total)
+    return total
@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .metrics import record_timing
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+class PasswordHasher:
+    """Runs password hashing in a small bounded thread pool.
+
+    scrypt and pbkdf2 release the GIL, so hashing on pool threads keeps the
+    worker's other threads responsive, and the pending-work cap makes a
+    login burst fail fast with `HashingBusy` instead of piling up behind
+    itself and starving every other route. That only helps under threaded
+    workers (gunicorn `--worker-class gthread`); with the default sync
+    worker the request thread still blocks on the result.
+    """
+
+    def __init__(self):
+        self.method = "scrypt:32768:8:1"
+        self.salt_length = 16
+        self.workers = 2
+        self.max_pending = 8
+        self.timeout = 2.0
+        self._prefix = None
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self._prefix = None
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.max_pending = app.config["PASSWORD_HASH_MAX_PENDING"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method, salt_length=self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if `pwhash` was made with other parameters than the configured ones."""
+        return pwhash.split("$", 1)[0] != self.prefix
+
+    @property
+    def prefix(self):
+        """The method as werkzeug writes it, e.g. "scrypt" -> "scrypt:32768:8:1"."""
+        if self._prefix is None:
+            self._prefix = generate_password_hash("", method=self.method, salt_length=1).split("$", 1)[0]
+        return self._prefix
+
+    def _run(self, func, *args, **kwargs):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._slots = threading.BoundedSemaphore(self.max_pending)
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="pwhash")
+
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy()
+        try:
+            return self._pool.submit(func, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+            record_timing("hash", time.perf_counter() - started)
+
+
+passwords = PasswordHasher()
@@ -0,0 +1,138 @@
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event, select
+
+from . import db
+from .models import Comment, Post, User
+
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\S+)$")
+_SQLITE_DERIVED = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\S+)$")
+
+
+@contextmanager
+def capture_selects(engine):
+    """Collect `(statement, parameters)` for every SELECT run on `engine`."""
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def hot_routes():
+    """URLs exercising each hot query shape, using rows that exist."""
+    post = db.session.execute(
+        select(Post.id).where(Post.is_published == True).order_by(Post.comment_count.desc()).limit(1)
+    ).scalar()
+    username = db.session.execute(
+        select(User.username).join(Post, Post.user_id == User.id).limit(1)
+    ).scalar()
+    word = db.session.execute(select(Post.title).limit(1)).scalar()
+    parent = db.session.execute(
+        select(Comment.parent_id).where(Comment.parent_id.is_not(None)).limit(1)
+    ).scalar()
+
+    routes = ["/home"]
+    if post:
+        routes.append(f"/post/{post}")
+    if username:
+        routes.append(f"/user/{username}")
+    if word:
+        routes.append(f"/search?q={word.split()[0]}")
+    if parent:
+        routes.append(f"/comment/{parent}/replies")
+    return routes
+
+
+def lookup_queries():
+    """Hot lookups made by POST handlers, checked directly."""
+    return [
+        ("reset_request", select(User.id).where(User.email == "someone@example.com")),
+        ("login", select(User.id).where(User.username == "someone")),
+        ("comment replies", select(Comment.id).where(Comment.parent_id == 1)),
+    ]
+
+
+def explain(connection, statement, parameters=None):
+    """Return the plan rows for `statement` as a list of dicts."""
+    dialect = connection.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters or ())
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def full_scans(dialect, plan, min_rows=0):
+    """Return the tables `plan` reads in full.
+
+    Scans of derived tables (materialized subqueries) are not counted; the
+    plan rows that fill them are checked on their own.
+    """
+    tables = []
+    derived = set()
+    for row in plan:
+        if dialect == "sqlite":
+            detail = row.get("detail", "")
+            m = _SQLITE_DERIVED.match(detail)
+            if m:
+                derived.add(m.group(1))
+                continue
+            m = _SQLITE_FULL_SCAN.match(detail)
+            if m and m.group(1) != "CONSTANT" and m.group(1) not in derived \
+                    and not m.group(1).startswith("(subquery-"):
+                tables.append(m.group(1))
+        elif str(row.get("type", "")).upper() == "ALL" and (row.get("rows") or 0) >= min_rows \
+                and not str(row.get("table", "")).startswith("<derived"):
+            tables.append(row.get("table"))
+    return tables
+
+
+def check_query_plans(app, min_rows=0):
+    """Explain the queries behind the hot routes and lookups.
+
+    The routes are driven through the test client and every SELECT they
+    issue is explained with its real parameters. Returns a list of
+    `(name, sql, plan, scans)` where `scans` lists the tables read in full.
+    """
+    results = []
+    with app.app_context():
+        from .authors import ensure_author_index
+        from .utils import ensure_search_index
+        # the one-off index builds read every post and user on purpose
+        ensure_search_index(db.session)
+        ensure_author_index(db.session)
+
+        captured = []
+        client = app.test_client()
+        for url in hot_routes():
+            with capture_selects(db.engine) as selects:
+                client.get(url)
+            captured.extend((url, sql, params) for sql, params in selects)
+
+        for name, stmt in lookup_queries():
+            compiled = stmt.compile(db.engine)
+            params = tuple(compiled.params[k] for k in compiled.positiontup) \
+                if compiled.positional else compiled.params
+            captured.append((name, str(compiled), params))
+
+        with db.engine.connect() as conn:
+            dialect = conn.dialect.name
+            seen = set()
+            for name, sql, params in captured:
+                if (name, sql) in seen:
+                    continue
+                seen.add((name, sql))
+                plan = explain(conn, sql, params)
+                results.append((name, sql, plan, full_scans(dialect, plan, min_rows)))
+    return results
@@ -0,0 +1,248 @@
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select
+
+from . import db
+from .models import Post, RelatedPost
+from .utils import post_tokens, published_stamp
+
+related_cli = AppGroup("related", help="Precompute related posts.")
+
+# neighbours below this cosine similarity aren't worth showing
+MIN_SCORE = 0.05
+
+
+def term_counts(tokens, vocabulary):
+    """`{column: count}` for `tokens`, adding new terms to `vocabulary`."""
+    counts = {}
+    for token in tokens:
+        j = vocabulary.setdefault(token, len(vocabulary))
+        counts[j] = counts.get(j, 0) + 1
+    return counts
+
+
+def tfidf_matrix(count_rows, n_terms):
+    """L2-normalized TF-IDF rows (sublinear tf, smoothed idf) as a CSR matrix,
+    from a list of `{column: count}` rows."""
+    # numpy/scipy are only needed by the job worker and CLI, not web workers
+    import numpy as np
+    from scipy import sparse
+
+    indptr, indices, data = [0], [], []
+    for counts in count_rows:
+        indices.extend(counts)
+        data.extend(counts.values())
+        indptr.append(len(indices))
+
+    n_docs = len(indptr) - 1
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+        shape=(n_docs, n_terms),
+    )
+    matrix.data = 1 + np.log(matrix.data)
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+    matrix = matrix.multiply(idf).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags((1 / norms).astype(np.float32)) @ matrix
+
+
+def nearest(matrix, rows, k, batch=256):
+    """Yield `(row, [(other_row, score), ...])` with the `k` most similar
+    rows to each of `rows`, best first, one dense batch of rows at a time."""
+    import numpy as np
+
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    for start in range(0, len(rows), batch):
+        chunk = rows[start:start + batch]
+        sims = (matrix[chunk] @ matrix.T).toarray()
+        sims[np.arange(len(chunk)), chunk] = 0
+        if k <= 0:
+            for row in chunk:
+                yield row, []
+            continue
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        for i, row in enumerate(chunk):
+            cols = top[i][np.argsort(-sims[i, top[i]], kind="stable")]
+            yield row, [(int(c), float(sims[i, c])) for c in cols if sims[i, c] >= MIN_SCORE]
+
+
+class Corpus:
+    """Term counts of every published post, kept between jobs in a worker.
+
+    Jobs only re-read the posts they were queued for plus anything written
+    since the last published stamp (by this or another worker), instead of
+    reading and tokenizing every post again. The weighted matrix is rebuilt
+    from the cached counts only when they changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.vocabulary = {}
+        self.counts = {}
+        self.stamp = None
+        self._matrix = None
+
+    def _read(self, query):
+        seen = set()
+        for post_id, title, content, published in query.yield_per(1000):
+            seen.add(post_id)
+            if published:
+                self.counts[post_id] = term_counts(post_tokens(title, content), self.vocabulary)
+            else:
+                self.counts.pop(post_id, None)
+            self._matrix = None
+        return seen
+
+    def refresh(self, post_ids=()):
+        """Catch up with the database; `post_ids` are always re-read."""
+        stamp = published_stamp(db.session)
+        query = db.session.query(Post.id, Post.title, Post.content, Post.is_published)
+        if self.stamp is None:
+            self.clear()
+            self._read(query.filter(Post.is_published == True))
+        else:
+            changed = Post.id.in_(post_ids) if post_ids else None
+            if stamp != self.stamp and self.stamp[0] is not None:
+                # >= so posts committed later within the same timestamp aren't missed
+                since = Post.date_updated >= self.stamp[0]
+                changed = since if changed is None else (changed | since)
+            seen = self._read(query.filter(changed)) if changed is not None else set()
+            for post_id in set(post_ids) - seen:
+                # deleted
+                if self.counts.pop(post_id, None) is not None:
+                    self._matrix = None
+            if len(self.counts) != stamp[1]:
+                published = {post_id for post_id, in db.session.query(Post.id).filter(Post.is_published == True)}
+                for post_id in set(self.counts) - published:
+                    del self.counts[post_id]
+                missing = published - set(self.counts)
+                if missing:
+                    self._read(query.filter(Post.id.in_(missing)))
+                self._matrix = None
+        self.stamp = stamp
+
+    def matrix(self):
+        """`(post ids, TF-IDF matrix)` with rows in id order."""
+        if self._matrix is None:
+            ids = sorted(self.counts)
+            self._matrix = ids, tfidf_matrix([self.counts[i] for i in ids], len(self.vocabulary))
+        return self._matrix
+
+
+corpus = Corpus()
+
+
+def _store(ids, matrix, rows, k, batch):
+    records = []
+    for row, neighbours in nearest(matrix, rows, k, batch):
+        records.extend(
+            dict(post_id=ids[row], rank=rank, related_id=ids[other], score=score)
+            for rank, (other, score) in enumerate(neighbours)
+        )
+    for i in range(0, len(records), 1000):
+        db.session.execute(insert(RelatedPost), records[i:i + 1000])
+    return len(records)
+
+
+def rebuild_related(k, batch=256):
+    """Recompute related posts for every published post and commit.
+
+    Returns `(posts, rows)` written.
+    """
+    with corpus.lock:
+        corpus.clear()
+        corpus.refresh()
+        ids, matrix = corpus.matrix()
+    db.session.execute(delete(RelatedPost))
+    written = _store(ids, matrix, list(range(len(ids))), k, batch)
+    db.session.commit()
+    return len(ids), written
+
+
+def update_related(post_ids, k, batch=256):
+    """Recompute the neighbours of `post_ids` and of every post whose list
+    they could enter or leave, then commit.
+
+    A post is recomputed if it currently lists one of `post_ids`, has fewer
+    than `k` neighbours, or is now more similar to one of them than to its
+    current last neighbour. Unpublished or deleted posts lose their rows.
+    Returns the number of posts recomputed.
+
+    Only those posts are recomputed, so as the idf of shared terms shifts
+    the stored lists drift from what `rebuild_related` would produce; run
+    the rebuild periodically to reset them.
+    """
+    with corpus.lock:
+        corpus.refresh(post_ids)
+        ids, matrix = corpus.matrix()
+        return _update_related(ids, matrix, post_ids, k, batch)
+
+
+def _update_related(ids, matrix, post_ids, k, batch):
+    import numpy as np
+
+    position = {post_id: i for i, post_id in enumerate(ids)}
+    touched = [p for p in post_ids if p in position]
+    gone = [p for p in post_ids if p not in position]
+
+    affected = set(touched)
+    affected.update(db.session.execute(
+        select(RelatedPost.post_id).where(RelatedPost.related_id.in_(post_ids))
+    ).scalars())
+
+    if touched:
+        sims = (matrix[[position[p] for p in touched]] @ matrix.T).toarray().max(axis=0)
+        candidates = [ids[i] for i in np.flatnonzero(sims >= MIN_SCORE)]
+        stored = {}
+        for i in range(0, len(candidates), 500):
+            stored.update(
+                (post_id, (count, floor))
+                for post_id, count, floor in db.session.execute(
+                    select(RelatedPost.post_id, func.count(), func.min(RelatedPost.score))
+                    .where(RelatedPost.post_id.in_(candidates[i:i + 500]))
+                    .group_by(RelatedPost.post_id)
+                )
+            )
+        for post_id in candidates:
+            count, floor = stored.get(post_id, (0, 0.0))
+            if count < k or sims[position[post_id]] > floor:
+                affected.add(post_id)
+
+    stale = list(affected | set(gone))
+    for i in range(0, len(stale), 500):
+        db.session.execute(delete(RelatedPost).where(RelatedPost.post_id.in_(stale[i:i + 500])))
+    rows = sorted(position[p] for p in affected if p in position)
+    _store(ids, matrix, rows, k, batch)
+    db.session.commit()
+    return len(rows)
+
+
+def load_related(post_id, limit):
+    """The stored related posts of `post_id`, best first, in one indexed query."""
+    return Post.list_query() \
+        .join(RelatedPost, RelatedPost.related_id == Post.id) \
+        .filter(RelatedPost.post_id == post_id, Post.is_published == True) \
+        .order_by(RelatedPost.rank) \
+        .limit(limit) \
+        .all()
+
+
+@related_cli.command("rebuild")
+@click.option("--k", "k", default=None, type=int, help="Neighbours per post (default: RELATED_POSTS_K).")
+@click.option("--batch", default=256, show_default=True, help="Posts per similarity batch.")
+def related_rebuild(k, batch):
+    """Recompute related posts for all published posts."""
+    started = time.perf_counter()
+    posts, rows = rebuild_related(k or current_app.config["RELATED_POSTS_K"], batch)
+    click.echo(f"Stored {rows} related posts for {posts} posts in {time.perf_counter() - started:.1f}s.")
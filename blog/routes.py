@@ -1,18 +1,86 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, abort, request, current_app
-from werkzeug.utils import redirect, secure_filename
+from flask import Blueprint, render_template, redirect, url_for, flash, abort, request, current_app, jsonify
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
+from werkzeug.utils import redirect
 from flask_login import login_required, current_user, logout_user, login_user
 from . import db
 
-import os
-import secrets
-
-from .models import Post, User, Comment, CommentLike
-from sqlalchemy import or_
-from .utils import recommend_for_query, tokenize
+from datetime import datetime
+
+from .models import Post, User, Comment, RelatedPost
+from .related import load_related
+from .feeds import feed_posts, feed_response
+from .deletion import delete_comment_subtree, delete_post as delete_post_cascade
+from .comments import load_comment_page
+from .counters import bump_comment_count, toggle_comment_like
+from .pagination import keyset_paginate, approximate_count, forget_count
+from .http_cache import conditional
+from .images import store_upload, avatar_url
+from .jobs import enqueue
+from .users import forget_user
+from .passwords import passwords, HashingBusy
+from .metrics import metrics, start_request, finish_request
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from .utils import search_posts, index_post, unindex_post
+from .authors import author_index, ensure_author_index, index_author
 from .forms import PostForm, CommentForm, EditProfileForm, RequestResetForm, ResetPasswordForm
 from itsdangerous import URLSafeTimedSerializer
 
 main = Blueprint("main", __name__)
+main.add_app_template_global(avatar_url)
+main.before_request(start_request)
+main.after_request(finish_request)
+
+
+# Cheap version tags for conditional GET, built from small indexed lookups.
+def _published_version(*args, **kwargs):
+    # single-row index lookups; the cached total catches deletes of older
+    # posts (at once in this worker, within a minute in the others)
+    last_id = db.session.query(func.max(Post.id)).scalar()
+    last_updated = db.session.query(func.max(Post.date_updated)).filter(Post.is_published == True).scalar()
+    total = approximate_count("home", Post.query.filter(Post.is_published == True))
+    return last_updated, last_id, total
+
+
+def _post_version(id):
+    # comment_count and activity cover new, deleted and liked comments
+    row = db.session.query(Post.date_updated, Post.comment_count, Post.activity, User.username, User.profile_image) \
+        .join(User, User.id == Post.user_id) \
+        .filter(Post.id == id).first()
+    if row is None:
+        return None
+    # related posts are recomputed in the background
+    related = db.session.query(func.sum(RelatedPost.related_id * (RelatedPost.rank + 1))) \
+        .filter(RelatedPost.post_id == id).scalar()
+    return tuple(row), related
+
+
+def _profile_version(username):
+    user = db.session.query(User.id, User.username, User.profile_image, User.full_name, User.bio,
+                            User.email, User.website, User.github, User.twitter) \
+        .filter(User.username == username).first()
+    if user is None:
+        return None
+    last, count = db.session.query(func.max(Post.date_updated), func.count(Post.id)) \
+        .filter(Post.user_id == user.id).one()
+    return tuple(user), last, count
+
+@main.errorhandler(HashingBusy)
+def hashing_busy(e):
+    # the password hashing pool is saturated; ask the user to retry rather
+    # than queueing more CPU-bound work behind the burst
+    flash("We're handling a lot of sign-ins right now. Please try again in a moment.", "warning")
+    return redirect(request.url)
+
+
+@main.route("/metrics")
+def prometheus_metrics():
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        abort(403)
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 
 @main.route("/register", methods=["GET", "POST"])
 def register():
@@ -38,6 +106,7 @@ def register():
 
         db.session.add(user)
         db.session.commit()
+        index_author(user)
 
         flash("Account created — please login", "success")
 
@@ -60,6 +129,13 @@ def login():
         user = User.query.filter_by(username=username).first()
 
         if user and user.check_password(password):
+            if passwords.needs_rehash(user.password_hash):
+                # upgrade hashes made with older parameters while we have the password
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except HashingBusy:
+                    pass
             login_user(user)
             flash("Logged in successfully", "success")
             return redirect(url_for("main.home"))
@@ -77,31 +153,71 @@ def logout():
 
 # User Profile Page
 @main.route("/user/<string:username>")
+@conditional(_profile_version)
 def user_profile(username):
     user = User.query.filter_by(username=username).first_or_404()
-    posts = user.posts
+    posts = keyset_paginate(
+        Post.list_query().filter(Post.user_id == user.id),
+        per_page=10,
+        after=request.args.get("after"),
+        before=request.args.get("before")
+    )
+    post_total = db.session.query(func.count(Post.id)).filter(Post.user_id == user.id).scalar()
 
     return render_template(
         "profile.html",
         user=user,
-        posts=posts
+        posts=posts,
+        post_total=post_total
     )
 
 
+def _feed_meta(title, home_url, **feed_args):
+    return {
+        "title": title,
+        "home_url": home_url,
+        "feed_url": url_for(request.endpoint, _external=True, **feed_args),
+        "post_url": lambda p: url_for("main.post_detail", id=p.id, _external=True),
+        "author_url": lambda p: url_for("main.user_profile", username=p.author.username, _external=True),
+    }
+
+
+@main.route("/feed.atom", defaults={"kind": "atom"}, endpoint="feed_atom")
+@main.route("/feed.json", defaults={"kind": "json"}, endpoint="feed_json")
+def feed(kind):
+    version = _published_version()
+    meta = _feed_meta("Bumfi", url_for("main.home", _external=True))
+    meta["updated"] = version[0]
+    posts = feed_posts(current_app.config["FEED_SIZE"])
+    return feed_response(kind, "all", version, posts, meta)
+
+
+@main.route("/user/<string:username>/feed.atom", defaults={"kind": "atom"}, endpoint="user_feed_atom")
+@main.route("/user/<string:username>/feed.json", defaults={"kind": "json"}, endpoint="user_feed_json")
+def user_feed(username, kind):
+    user = db.session.query(User.id, User.username, User.full_name, User.date_updated) \
+        .filter(User.username == username).first()
+    if user is None:
+        abort(404)
+    updated, count = db.session.query(func.max(Post.date_updated), func.count(Post.id)) \
+        .filter(Post.user_id == user.id, Post.is_published == True).one()
+    meta = _feed_meta(f"{user.full_name or user.username} on Bumfi",
+                      url_for("main.user_profile", username=user.username, _external=True), username=username)
+    # a user without posts still needs a feed-level <updated>
+    meta["updated"] = updated or user.date_updated
+    posts = feed_posts(current_app.config["FEED_SIZE"], user_id=user.id)
+    return feed_response(kind, f"user:{user.id}", (tuple(user), updated, count), posts, meta)
+
+
 def save_profile_picture(file_storage):
     if not file_storage:
         return None
 
-    filename = secure_filename(file_storage.filename)
-    _, ext = os.path.splitext(filename)
-    unique = secrets.token_hex(8)
-    new_name = f"{unique}{ext}"
-
     upload_folder = current_app.config.get('UPLOAD_FOLDER')
-    os.makedirs(upload_folder, exist_ok=True)
-
-    path = os.path.join(upload_folder, new_name)
-    file_storage.save(path)
+    new_name = store_upload(file_storage, upload_folder)
+    if new_name:
+        # resizing runs in `flask jobs work`; avatar_url serves the original until then
+        enqueue("avatar_renditions", name=new_name)
 
     return new_name
 
@@ -110,18 +226,35 @@ def landing_page():
     return render_template("landing_page.html")
 
 @main.route("/home")
+@conditional(_published_version)
 def home():
-    page = request.args.get("page", 1, type=int)
-
-    posts = Post.query \
-        .filter(Post.is_published == True) \
-        .order_by(Post.date_created.desc()) \
-        .paginate(page=page, per_page=5)
+    published = Post.list_query().filter(Post.is_published == True)
+
+    # numbered pages are kept for old links; everything else uses cursors
+    if "page" in request.args:
+        page = request.args.get("page", 1, type=int)
+        posts = published \
+            .order_by(Post.date_created.desc()) \
+            .paginate(page=page, per_page=5)
+        return render_template("home.html", posts=posts)
+
+    total = None
+    if current_app.config["FEED_APPROX_TOTAL"]:
+        total = approximate_count("home", published)
+
+    posts = keyset_paginate(
+        published,
+        per_page=5,
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        total=total
+    )
 
     return render_template("home.html", posts=posts)
 
 
 @main.route('/search')
+@conditional(_published_version)
 def search():
     q = request.args.get('q', '').strip()
     results = []
@@ -129,21 +262,29 @@ def search():
     authors = []
 
     if q:
-        results = recommend_for_query(q, limit=20, session=db.session)
+        # one ranking pass: top results plus the recommended tail after them
+        results, recs = search_posts(q, limit=20, recommended=6, session=db.session)
 
-        # recommendations: top matches excluding the top results (by id)
-        top_ids = {p.id for p in results}
-        candidates = recommend_for_query(q, limit=50, session=db.session)
-        recs = [p for p in candidates if p.id not in top_ids][:6]
-
-        # find matching authors (username, full_name, bio)
-        pattern = f"%{q}%"
-        authors = User.query.filter(
-            or_(User.username.ilike(pattern), User.full_name.ilike(pattern), User.bio.ilike(pattern))
-        ).limit(6).all()
+        # matching authors come from the in-memory name prefix / bio term index
+        ensure_author_index(db.session)
+        authors = author_index.search(q, limit=6)
 
     return render_template('search.html', q=q, results=results, recs=recs, authors=authors)
 
+@main.route('/authors/typeahead')
+def author_typeahead():
+    q = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 20)
+    ensure_author_index(db.session)
+    authors = author_index.prefix(q, limit=limit)
+    response = jsonify(authors=[
+        dict(a.to_dict(), url=url_for('main.user_profile', username=a.username)) for a in authors
+    ])
+    response.cache_control.public = True
+    response.cache_control.max_age = 30
+    return response
+
+
 @main.route("/create", methods=["GET", "POST"])
 @login_required
 def create_post():
@@ -161,12 +302,16 @@ def create_post():
         post = Post(
             title=form.title.data,
             content=form.content.data,
-            author=current_user,
+            user_id=current_user.id,
             is_published=is_published
         )
 
         db.session.add(post)
+        if is_published:
+            db.session.flush()
+            enqueue("related_posts", post_ids=[post.id])
         db.session.commit()
+        index_post(post)
 
         flash(
             "Post published!" if is_published else "Draft saved.",
@@ -185,25 +330,32 @@ def create_post():
 @login_required
 def account():
     form = EditProfileForm()
+    # current_user is a cached snapshot; edit the real row
+    user = db.session.get(User, current_user.id)
 
     if request.method == 'GET':
-        form.username.data = current_user.username
-        form.email.data = current_user.email
-        form.full_name.data = current_user.full_name
-        form.bio.data = current_user.bio
+        form.username.data = user.username
+        form.email.data = user.email
+        form.full_name.data = user.full_name
+        form.bio.data = user.bio
 
     if form.validate_on_submit():
         # handle picture
         if form.picture.data:
             pic_name = save_profile_picture(form.picture.data)
             if pic_name:
-                current_user.profile_image = pic_name
-
-        current_user.username = form.username.data
-        current_user.email = form.email.data
-        current_user.full_name = form.full_name.data
-        current_user.bio = form.bio.data
+                user.profile_image = pic_name
+            else:
+                flash('That file is not a valid image.', 'warning')
+
+        user.username = form.username.data
+        user.email = form.email.data
+        user.full_name = form.full_name.data
+        user.bio = form.bio.data
+        user.date_updated = datetime.utcnow()
         db.session.commit()
+        forget_user(user.id)
+        index_author(user)
 
         flash('Account updated.', 'success')
         return redirect(url_for('main.account'))
@@ -211,12 +363,10 @@ def account():
     return render_template('edit_account.html', form=form)
 
 
-def send_reset_email(user, token):
-    # Simple fallback: print link to console and flash message.
-    reset_url = url_for('main.reset_token', token=token, _external=True)
-    # In production, integrate Flask-Mail or other mail provider.
-    print(f"Password reset link for {user.email}: {reset_url}")
-    flash('If an account exists for that email, a reset link has been sent (check console in dev).', 'info')
+def send_reset_email(user):
+    # delivered by `flask jobs work`; the request never waits on SMTP. The
+    # worker signs the token, so no live token is ever stored in a job row.
+    enqueue("reset_email", user_id=user.id, base_url=current_app.config["BASE_URL"] or request.url_root)
 
 
 @main.route('/reset_password', methods=['GET', 'POST'])
@@ -228,11 +378,11 @@ def reset_request():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user:
-            s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
-            token = s.dumps({'user_id': user.id})
-            send_reset_email(user, token)
+            send_reset_email(user)
+            db.session.commit()
 
         # Always flash the same message to avoid revealing accounts
+        flash('If an account exists for that email, a reset link has been sent.', 'info')
         return redirect(url_for('main.login'))
 
     return render_template('reset_request.html', form=form)
@@ -260,6 +410,7 @@ def reset_token(token):
     if form.validate_on_submit():
         user.set_password(form.password.data)
         db.session.commit()
+        forget_user(user.id)
         flash('Your password has been updated. Please log in.', 'success')
         return redirect(url_for('main.login'))
 
@@ -271,18 +422,22 @@ def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
 
     # Ownership Verify
-    if post.author != current_user:
+    if not current_user.is_authenticated or post.user_id != current_user.id:
         abort(403)
 
-    db.session.delete(post)
+    # comments, likes and related rows go with it, set-based
+    delete_post_cascade(post_id)
     db.session.commit()
+    unindex_post(post_id)
+    forget_count("home")
 
     flash("Post deleted successfully.", "success")
     return redirect(url_for("main.home"))
 
 @main.route("/post/<int:id>", methods=["GET", "POST"])
+@conditional(_post_version)
 def post_detail(id):
-    post = Post.query.get_or_404(id)
+    post = Post.query.options(joinedload(Post.author)).filter_by(id=id).first_or_404()
     form = CommentForm()
     if form.validate_on_submit():
         if not current_user.is_authenticated:
@@ -298,34 +453,101 @@ def post_detail(id):
 
         comment = Comment(
             content=form.content.data,
-            author=current_user,
+            user_id=current_user.id,
             post=post,
             parent_id=parent_id
         )
 
         db.session.add(comment)
+        bump_comment_count(post.id, 1)
         db.session.commit()
 
         flash("Comment added", "success")
         return redirect(url_for("main.post_detail", id=id))
 
+    per_page = current_app.config["COMMENT_PAGE_SIZE"]
+    comments, total = _comment_page(post_id=post.id, offset=0, limit=per_page)
+    more_url = None
+    if total > per_page:
+        more_url = url_for("main.post_comments", id=post.id, offset=per_page)
+
     return render_template(
         "post_detail.html",
         post=post,
-        form=form
+        form=form,
+        comments=comments,
+        related=load_related(post.id, current_app.config["RELATED_POSTS_K"]),
+        more_url=more_url,
+        more_label=f"Show {total - per_page} more comments"
+    )
+
+
+def _comment_page(**kwargs):
+    config = current_app.config
+    return load_comment_page(
+        depth=config["COMMENT_DEPTH"],
+        per_parent=config["COMMENT_REPLIES_PER_PARENT"],
+        user_id=current_user.id if current_user.is_authenticated else None,
+        **kwargs
     )
 
+
+def _comment_fragment(nodes, total, offset, limit, depth, next_url):
+    """Answer with JSON or an HTML fragment for comments.js to insert."""
+    next_offset = offset + len(nodes)
+    has_more = next_offset < total
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(
+            comments=[n.to_dict() for n in nodes],
+            total=total,
+            next_offset=next_offset if has_more else None
+        )
+    more_url = next_url(next_offset) if has_more else None
+    return render_template(
+        "_comment_list.html",
+        comments=nodes,
+        form=CommentForm(),
+        depth=depth,
+        more_url=more_url,
+        more_label=f"Show {total - next_offset} more"
+    )
+
+
+@main.route("/post/<int:id>/comments")
+def post_comments(id):
+    if not db.session.query(Post.id).filter(Post.id == id).first():
+        abort(404)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", current_app.config["COMMENT_PAGE_SIZE"], type=int), 1), 50)
+    nodes, total = _comment_page(post_id=id, offset=offset, limit=limit)
+    return _comment_fragment(nodes, total, offset, limit, 0,
+                             lambda o: url_for("main.post_comments", id=id, offset=o, limit=limit))
+
+
+@main.route("/comment/<int:id>/replies")
+def comment_replies(id):
+    if not db.session.query(Comment.id).filter(Comment.id == id).first():
+        abort(404)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", current_app.config["COMMENT_REPLIES_PER_PARENT"], type=int), 1), 50)
+    # depth only sets the indentation of the returned fragment
+    depth = min(max(request.args.get("depth", 1, type=int), 0), 20)
+    nodes, total = _comment_page(parent_id=id, offset=offset, limit=limit)
+    return _comment_fragment(nodes, total, offset, limit, depth,
+                             lambda o: url_for("main.comment_replies", id=id, offset=o, limit=limit, depth=depth))
+
 @main.route("/comment/<int:id>/delete")
 @login_required
 def delete_comment(id):
     comment = Comment.query.get_or_404(id)
 
-    if comment.author != current_user:
+    if comment.user_id != current_user.id:
         abort(403)
 
-    post_id = comment.post.id
+    post_id = comment.post_id
 
-    db.session.delete(comment)
+    # replies and likes go with it, without loading the thread
+    delete_comment_subtree(comment)
     db.session.commit()
 
     flash("Comment deleted", "success")
@@ -335,21 +557,27 @@ def delete_comment(id):
 @main.route('/comment/<int:comment_id>/like', methods=['POST'])
 @login_required
 def like_comment(comment_id):
-    comment = Comment.query.get_or_404(comment_id)
-
-    # toggle like
-    existing = CommentLike.query.filter_by(user_id=current_user.id, comment_id=comment_id).first()
-    if existing:
-        db.session.delete(existing)
-        db.session.commit()
-        flash('Removed like', 'info')
-    else:
-        like = CommentLike(user_id=current_user.id, comment_id=comment_id)
-        db.session.add(like)
-        db.session.commit()
-        flash('Comment liked', 'success')
-
-    return redirect(url_for('main.post_detail', id=comment.post.id))
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken') or request.form.get('csrf_token'))
+        except ValidationError:
+            if wants_json:
+                return jsonify(error='The CSRF token is missing or invalid.'), 400
+            abort(400)
+
+    if wants_json:
+        # called from comments.js: answer with the new state, no page render
+        result = toggle_comment_like(current_user.id, comment_id)
+        if result is None:
+            return jsonify(error='Comment not found.'), 404
+        liked, like_count = result
+        return jsonify(liked=liked, like_count=like_count)
+
+    post_id = db.session.query(Comment.post_id).filter(Comment.id == comment_id).scalar()
+    if post_id is None or toggle_comment_like(current_user.id, comment_id) is None:
+        abort(404)
+    return redirect(url_for('main.post_detail', id=post_id, _anchor=f'comment-{comment_id}'))
 
 
 # post update -- here a user can update/edit their posts
@@ -361,7 +589,7 @@ def edit_post(id):
     post = Post.query.get_or_404(id)
     form = PostForm()
 
-    if post.author != current_user:
+    if post.user_id != current_user.id:
         abort(403)
 
     if request.method == "GET":
@@ -372,8 +600,11 @@ def edit_post(id):
     if form.validate_on_submit():
         post.title = form.title.data
         post.content = form.content.data
+        post.date_updated = datetime.utcnow()
+        enqueue("related_posts", post_ids=[post.id])
 
         db.session.commit()
+        index_post(post)
         flash("Post updated successfully!", "success")
 
         return redirect(url_for("main.post_detail", id=post.id))
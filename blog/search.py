@@ -0,0 +1,163 @@
+import heapq
+import math
+from bisect import bisect_left
+import threading
+from array import array
+from datetime import datetime
+
+
+class SearchIndex:
+    """In-process inverted index over published posts, ranked with BM25.
+
+    Postings are kept per term as two parallel unsigned int arrays
+    (post ids and term frequencies) instead of lists of tuples, which keeps
+    the memory footprint close to 8 bytes per posting. Ids are kept sorted,
+    so a post is found in a posting list by bisection.
+
+    The index is built lazily from the database on first use and then kept
+    up to date by `add` / `remove` as posts are created, edited and deleted.
+    Each worker process holds its own copy; `stamp` records the database
+    state it last caught up with, so writes made by other workers are
+    picked up too (see `blog.utils.ensure_search_index`).
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._loaded = False
+        # bumped on every change so cached results can be keyed on it
+        self.version = 0
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            # term -> (array of post ids, array of term frequencies)
+            self._postings = {}
+            # post id -> (document length, distinct terms, created timestamp)
+            self._docs = {}
+            self._total_length = 0
+            self._loaded = False
+            self.stamp = None
+            self.version += 1
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __len__(self):
+        return len(self._docs)
+
+    def post_ids(self):
+        with self._lock:
+            return set(self._docs)
+
+    def load(self, rows, stamp=None):
+        """Rebuild the index from an iterable of `(post_id, tokens, created)`."""
+        with self._lock:
+            self.clear()
+            for post_id, tokens, created in rows:
+                self._add(post_id, tokens, created)
+            self._loaded = True
+            self.stamp = stamp
+
+    def add(self, post_id, tokens, created):
+        """Index (or re-index) a single post."""
+        with self._lock:
+            self._remove(post_id)
+            self._add(post_id, tokens, created)
+            self.version += 1
+
+    def remove(self, post_id):
+        with self._lock:
+            self._remove(post_id)
+            self.version += 1
+
+    def _add(self, post_id, tokens, created):
+        if not tokens:
+            return
+        counts = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+
+        for term, tf in counts.items():
+            entry = self._postings.get(term)
+            if entry is None:
+                entry = self._postings[term] = (array('I'), array('I'))
+            ids, tfs = entry
+            if not ids or ids[-1] < post_id:
+                ids.append(post_id)
+                tfs.append(tf)
+            else:
+                # re-indexed older post
+                i = bisect_left(ids, post_id)
+                ids.insert(i, post_id)
+                tfs.insert(i, tf)
+
+        self._docs[post_id] = (len(tokens), tuple(counts), _timestamp(created))
+        self._total_length += len(tokens)
+
+    def _remove(self, post_id):
+        doc = self._docs.pop(post_id, None)
+        if doc is None:
+            return
+        length, terms, _ = doc
+        self._total_length -= length
+
+        for term in terms:
+            ids, tfs = self._postings[term]
+            i = bisect_left(ids, post_id)
+            if len(ids) == 1:
+                del self._postings[term]
+            else:
+                del ids[i]
+                del tfs[i]
+
+    def search(self, tokens, limit, now=None):
+        """Return up to `limit` `(score, post_id)` pairs, best first.
+
+        The score is BM25 over the query terms plus the same small recency
+        boost the LIKE-based scorer used.
+        """
+        with self._lock:
+            n_docs = len(self._docs)
+            if not tokens or not n_docs:
+                return []
+
+            avgdl = self._total_length / n_docs
+            k1, b = self.k1, self.b
+            scores = {}
+
+            for term in set(tokens):
+                entry = self._postings.get(term)
+                if entry is None:
+                    continue
+                ids, tfs = entry
+                df = len(ids)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for post_id, tf in zip(ids, tfs):
+                    dl = self._docs[post_id][0]
+                    s = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+                    scores[post_id] = scores.get(post_id, 0.0) + s
+
+            now = _timestamp(now or datetime.utcnow())
+            docs = self._docs
+            ranked = (
+                (s + recency_boost(now - docs[post_id][2]), post_id)
+                for post_id, s in scores.items()
+            )
+            return heapq.nlargest(limit, ranked)
+
+
+def recency_boost(age_seconds):
+    """Small boost in (0, 1] so that newer posts score slightly higher."""
+    return 1.0 / (1 + max(age_seconds, 0) / (3600 * 24 * 30))
+
+
+def _timestamp(dt):
+    if dt is None:
+        return 0.0
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+search_index = SearchIndex()
@@ -1,19 +1,60 @@
-// Toggle hidden reply groups
+// Comment thread behaviour. Handlers are delegated from the document so
+// they also work for comments fetched after the page loaded.
 document.addEventListener('DOMContentLoaded', function(){
-  document.querySelectorAll('.show-more-replies').forEach(function(btn){
-    btn.addEventListener('click', function(e){
-      var id = this.getAttribute('data-target');
-      var el = document.getElementById(id);
-      if(!el) return;
-      if(el.style.display === 'none' || el.style.display === ''){
-        el.style.display = 'block';
-        this.textContent = 'Hide replies';
-      } else {
-        el.style.display = 'none';
-        // extract count from data-target label (best-effort)
-        var hidden = el.querySelectorAll('.comment').length;
-        this.textContent = 'Show ' + hidden + ' more replies';
-      }
+
+  // Toggle the reply form under a comment
+  document.addEventListener('click', function(e){
+    var link = e.target.closest('.reply-link');
+    if(!link) return;
+    e.preventDefault();
+    var box = document.getElementById('reply-form-' + link.getAttribute('data-comment-id'));
+    if(!box) return;
+    box.style.display = (box.style.display === 'none' || box.style.display === '') ? 'block' : 'none';
+    var ta = box.querySelector('textarea'); if(ta) ta.focus();
+  });
+
+  // Fetch more comments or replies and put them where the button was
+  document.addEventListener('click', function(e){
+    var btn = e.target.closest('.load-more-comments');
+    if(!btn || !window.fetch) return;
+    e.preventDefault();
+    btn.disabled = true;
+    fetch(btn.getAttribute('data-url'), {credentials: 'same-origin', headers: {'Accept': 'text/html'}})
+      .then(function(res){
+        if(!res.ok) throw res;
+        return res.text();
+      }).then(function(html){
+        btn.insertAdjacentHTML('beforebegin', html);
+        btn.remove();
+      }).catch(function(){
+        btn.disabled = false;
+      });
+  });
+
+  // Like / unlike without reloading the page; falls back to a normal submit
+  document.addEventListener('submit', function(e){
+    var form = e.target.closest('.like-form');
+    if(!form || !window.fetch) return;
+    e.preventDefault();
+    var btn = form.querySelector('.like-btn');
+    var token = form.querySelector('input[name="csrf_token"]');
+    btn.disabled = true;
+    fetch(form.action, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: {'Accept': 'application/json', 'X-CSRFToken': token ? token.value : ''}
+    }).then(function(res){
+      var type = res.headers.get('Content-Type') || '';
+      if(!res.ok || type.indexOf('application/json') === -1) throw res;
+      return res.json();
+    }).then(function(data){
+      btn.querySelector('.like-count').textContent = data.like_count;
+      btn.classList.toggle('liked', data.liked);
+      btn.setAttribute('aria-pressed', data.liked ? 'true' : 'false');
+      btn.disabled = false;
+    }).catch(function(){
+      // e.g. logged out: let the server handle it the old way
+      form.submit();
     });
   });
 });
@@ -0,0 +1,183 @@
+import gzip
+import json
+import sys
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+
+from . import db
+from .counters import repair_counters
+from .models import Comment, CommentLike, Post, User, make_excerpt
+
+data_cli = AppGroup("data", help="Bulk import and export as JSON lines.")
+
+# record type -> (model, exported columns, datetime columns); parents first,
+# so ids referenced by a record are always inserted before it
+RECORDS = {
+    "user": (User, ("id", "username", "email", "password_hash", "profile_image", "full_name", "bio",
+                    "website", "github", "twitter"), ()),
+    "post": (Post, ("id", "user_id", "title", "content", "date_created", "date_updated", "is_published"),
+             ("date_created", "date_updated")),
+    "comment": (Comment, ("id", "post_id", "user_id", "parent_id", "content", "date_created"), ("date_created",)),
+    "like": (CommentLike, ("id", "user_id", "comment_id"), ()),
+}
+
+# accounts imported without a hash can only get in through a password reset
+UNUSABLE_PASSWORD = "!"
+
+
+def _open(path, mode):
+    if path == "-":
+        return sys.stdout if "w" in mode else sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _prepare(kind, record):
+    model, columns, datetimes = RECORDS[kind]
+    row = {c: record.get(c) for c in columns if c in record}
+    for c in datetimes:
+        if row.get(c):
+            row[c] = datetime.fromisoformat(row[c])
+    if kind == "user":
+        row.setdefault("password_hash", None)
+        row["password_hash"] = row["password_hash"] or UNUSABLE_PASSWORD
+    elif kind == "post":
+        row["excerpt"] = make_excerpt(row.get("content"))
+        row.setdefault("date_created", datetime.utcnow())
+        row["date_updated"] = row.get("date_updated") or row["date_created"]
+        # like the model default, a record that doesn't say it is published stays a draft
+        row["is_published"] = bool(row.get("is_published"))
+    elif kind == "comment":
+        row.setdefault("date_created", datetime.utcnow())
+        row.setdefault("parent_id", None)
+    return row
+
+
+class _Progress:
+    def __init__(self, every=100_000):
+        self.started = time.perf_counter()
+        self.counts = dict.fromkeys(RECORDS, 0)
+        self.every = every
+        self._next = every
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def add(self, kind, n):
+        self.counts[kind] += n
+        if self.total >= self._next:
+            self._next += self.every
+            click.echo(f"  {self.total} rows, {self.rate():.0f} rows/s", err=True)
+
+    def rate(self):
+        return self.total / max(time.perf_counter() - self.started, 1e-9)
+
+    def summary(self, verb):
+        parts = ", ".join(f"{n} {kind}s" for kind, n in self.counts.items() if n)
+        elapsed = time.perf_counter() - self.started
+        return f"{verb} {parts or 'nothing'} in {elapsed:.1f}s ({self.rate():.0f} rows/s)."
+
+
+def import_records(lines, chunk_size, progress):
+    """Insert JSON lines with one executemany per `chunk_size` rows per type.
+
+    Rows are buffered per record type; before a buffer is written every
+    buffer of a parent type is written first, so foreign keys always point
+    at rows that exist. Each chunk is committed, keeping both memory and
+    transaction size bounded whatever the input size.
+    """
+    order = list(RECORDS)
+    buffers = {kind: [] for kind in order}
+
+    def flush(upto):
+        for kind in order[:order.index(upto) + 1]:
+            rows = buffers[kind]
+            if rows:
+                db.session.execute(insert(RECORDS[kind][0]), rows)
+                progress.add(kind, len(rows))
+                buffers[kind] = []
+        db.session.commit()
+
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            kind = record.pop("type")
+            row = _prepare(kind, record)
+        except (ValueError, KeyError) as e:
+            raise click.ClickException(f"line {number}: {e!r}")
+        buffers[kind].append(row)
+        if len(buffers[kind]) >= chunk_size:
+            flush(kind)
+    flush(order[-1])
+
+
+def export_records(out, chunk_size, progress):
+    """Write every row as a JSON line, parents first, streaming `chunk_size` rows at a time."""
+    for kind, (model, columns, datetimes) in RECORDS.items():
+        stmt = select(*(getattr(model, c) for c in columns)).order_by(model.id)
+        result = db.session.execute(stmt, execution_options={"yield_per": chunk_size})
+        for partition in result.partitions():
+            for values in partition:
+                record = {"type": kind}
+                for c, v in zip(columns, values):
+                    record[c] = v.isoformat() if c in datetimes and v is not None else v
+                out.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            progress.add(kind, len(partition))
+
+
+@data_cli.command("import")
+@click.argument("path")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows per executemany and commit.")
+def data_import(path, chunk_size):
+    """Import users, posts, comments and likes from a JSON lines file ('-' for stdin, .gz ok).
+
+    Each line is an object with a "type" of user, post, comment or like
+    and the columns written by `flask data export`. Ids are kept, so
+    comment threads and likes stay attached.
+    """
+    progress = _Progress()
+    with _open(path, "r") as fh:
+        try:
+            import_records(fh, chunk_size, progress)
+        except Exception:
+            db.session.rollback()
+            click.echo(progress.summary("Imported (before the error)"), err=True)
+            raise
+
+    click.echo("Recomputing counters...", err=True)
+    repair_counters()
+
+    # this process only; web workers catch their indexes up on the next search
+    from .authors import author_index
+    from .search import search_index
+    from .utils import search_cache
+    search_index.clear()
+    search_cache.clear()
+    author_index.clear()
+
+    click.echo(progress.summary("Imported"), err=True)
+    click.echo("Run `flask related rebuild` to refresh related posts.", err=True)
+
+
+@data_cli.command("export")
+@click.argument("path", default="-")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows fetched per round trip.")
+def data_export(path, chunk_size):
+    """Export users, posts, comments and likes as JSON lines ('-' for stdout, .gz ok)."""
+    progress = _Progress()
+    out = _open(path, "w")
+    try:
+        export_records(out, chunk_size, progress)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    click.echo(progress.summary("Exported"), err=True)
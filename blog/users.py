@@ -0,0 +1,60 @@
+from . import db
+from .cache import TTLCache
+from .models import User
+
+# user id -> UserSnapshot, per process; bounded and short-lived so changes
+# made through another worker show up within `ttl` seconds
+user_cache = TTLCache(maxsize=4096, ttl=60)
+
+
+class UserSnapshot:
+    """Read-only stand-in for `User` used as `current_user`.
+
+    Holds only what templates and ownership checks need, and implements the
+    Flask-Login user interface. It compares equal to the `User` row with the
+    same id, so `post.author == current_user` keeps working. Views that
+    modify the account load the real `User` row instead.
+    """
+
+    __slots__ = ("id", "username", "profile_image")
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username, profile_image):
+        self.id = id
+        self.username = username
+        self.profile_image = profile_image
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if hasattr(other, "get_id") and not getattr(other, "is_anonymous", False):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def load_user_snapshot(user_id):
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        row = db.session.query(User.id, User.username, User.profile_image) \
+            .filter(User.id == user_id).first()
+        if row is None:
+            return None
+        snapshot = UserSnapshot(*row)
+        user_cache.set(user_id, snapshot)
+    return snapshot
+
+
+def forget_user(user_id):
+    """Drop the cached snapshot after the user's row changed."""
+    user_cache.pop(user_id)
@@ -1,11 +1,18 @@
 import re
-from datetime import datetime
-from sqlalchemy import or_
+import threading
+import time
 
+from sqlalchemy import func
+
+from .cache import TTLCache
 from .models import Post
+from .search import search_index
 
 WORD_RE = re.compile(r"\w+")
 
+# ranked post ids keyed on (index version, normalized tokens, limit)
+search_cache = TTLCache(maxsize=512, ttl=300)
+
 
 def tokenize(q):
     if not q:
@@ -13,22 +20,134 @@ def tokenize(q):
     return [t.lower() for t in WORD_RE.findall(q) if len(t) > 1]
 
 
-def score_post_for_query(post, tokens):
-    text = ((post.title or "") + " " + (post.content or "")).lower()
-    match_count = sum(text.count(t) for t in tokens)
+def post_tokens(title, content):
+    return tokenize((title or "") + " " + (content or ""))
+
+
+_sync_lock = threading.Lock()
+
+# the stamp is a full count, so it is checked at most this often per process
+SYNC_INTERVAL = 2.0
+_checked_at = [0.0]
+
+
+def published_stamp(session):
+    """`(latest date_updated, count)` of published posts; one small aggregate query."""
+    return tuple(session.query(func.max(Post.date_updated), func.count(Post.id))
+                 .filter(Post.is_published == True).one())
+
+
+def ensure_search_index(session):
+    """Build the in-process search index, or catch it up with the database.
+
+    Posts written through another worker process change the published
+    stamp; when it moves, posts updated since the last stamp are re-read
+    and, if the count still disagrees, deleted or unpublished posts are
+    dropped by comparing ids. The stamp is read at most every
+    `SYNC_INTERVAL` seconds, so other workers' writes show up within that.
+    """
+    now = time.monotonic()
+    if search_index.loaded and now - _checked_at[0] < SYNC_INTERVAL:
+        return
+    _checked_at[0] = now
+    stamp = published_stamp(session)
+    if search_index.loaded and search_index.stamp == stamp:
+        return
+
+    with _sync_lock:
+        if not search_index.loaded:
+            # in id order, so postings are built by appending
+            rows = session.query(Post.id, Post.title, Post.content, Post.date_created) \
+                .filter(Post.is_published == True) \
+                .order_by(Post.id) \
+                .yield_per(1000)
+            search_index.load(
+                ((post_id, post_tokens(title, content), created)
+                 for post_id, title, content, created in rows),
+                stamp,
+            )
+        elif search_index.stamp != stamp:
+            _catch_up(session, stamp)
+
+
+def _catch_up(session, stamp):
+    last_seen = search_index.stamp[0] if search_index.stamp else None
+    query = session.query(Post.id, Post.title, Post.content, Post.date_created, Post.is_published)
+    if last_seen is not None:
+        # >= so posts committed later within the same timestamp aren't missed
+        query = query.filter(Post.date_updated >= last_seen)
+    for post_id, title, content, created, published in query.yield_per(1000):
+        if published:
+            search_index.add(post_id, post_tokens(title, content), created)
+        else:
+            search_index.remove(post_id)
+
+    if len(search_index) != stamp[1]:
+        published = {post_id for post_id, in session.query(Post.id).filter(Post.is_published == True)}
+        indexed = search_index.post_ids()
+        for post_id in indexed - published:
+            search_index.remove(post_id)
+        missing = published - indexed
+        if missing:
+            for post_id, title, content, created in session.query(
+                    Post.id, Post.title, Post.content, Post.date_created).filter(Post.id.in_(missing)):
+                search_index.add(post_id, post_tokens(title, content), created)
+    search_index.stamp = stamp
 
-    # small recency boost (newer posts score slightly higher)
-    try:
-        age_seconds = (datetime.utcnow() - post.date_created).total_seconds()
-        recency = 1.0 / (1 + age_seconds / (3600 * 24 * 30))
-    except Exception:
-        recency = 0
 
-    return match_count + recency
+def index_post(post):
+    """Keep the search index in sync after `post` has been committed."""
+    if not search_index.loaded:
+        return
+    if post.is_published:
+        search_index.add(post.id, post_tokens(post.title, post.content), post.date_created)
+    else:
+        search_index.remove(post.id)
+    search_cache.clear()
+
+
+def unindex_post(post_id):
+    if search_index.loaded:
+        search_index.remove(post_id)
+    search_cache.clear()
+
+
+def ranked_post_ids(tokens, limit, session):
+    """Return the ids of the best `limit` posts for `tokens`, cached."""
+    ensure_search_index(session)
+    key = (search_index.version, tuple(sorted(set(tokens))), limit)
+    ids = search_cache.get(key)
+    if ids is None:
+        ids = tuple(post_id for _, post_id in search_index.search(tokens, limit))
+        search_cache.set(key, ids)
+    return ids
+
+
+def load_posts(ids, session):
+    """Fetch posts by id in one query, preserving the order of `ids`."""
+    if not ids:
+        return []
+    posts = {p.id: p for p in Post.list_query().with_session(session).filter(Post.id.in_(ids))}
+    return [posts[i] for i in ids if i in posts]
+
+
+def search_posts(query, limit=20, recommended=6, session=None):
+    """Rank once and return `(results, recommended)` for `query`.
+
+    `results` are the top `limit` posts and `recommended` the next
+    `recommended` posts after them.
+    """
+    tokens = tokenize(query)
+    if not tokens or session is None:
+        return [], []
+
+    ids = ranked_post_ids(tokens, limit + recommended, session)
+    posts = load_posts(ids, session)
+    return posts[:limit], posts[limit:]
 
 
 def recommend_for_query(query, limit=6, session=None):
-    """Return top posts matching `query` using a simple SQL LIKE + python scoring.
+    """Return top posts matching `query`, ranked by BM25 plus a recency boost.
 
     - session should be the SQLAlchemy session (e.g. db.session).
     - limit controls number of returned posts.
@@ -37,23 +156,4 @@ def recommend_for_query(query, limit=6, session=None):
     if not tokens or session is None:
         return []
 
-    # broad candidate set (limit to keep it fast)
-    filters = []
-    for t in tokens:
-        pattern = f"%{t}%"
-        filters.append(Post.title.ilike(pattern))
-        filters.append(Post.content.ilike(pattern))
-
-    candidates = session.query(Post) \
-        .filter(or_(*filters)) \
-        .filter(Post.is_published == True) \
-        .limit(300).all()
-
-    scored = []
-    for p in candidates:
-        s = score_post_for_query(p, tokens)
-        if s > 0:
-            scored.append((s, p))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [p for _, p in scored[:limit]]
+    return load_posts(ranked_post_ids(tokens, limit, session), session)
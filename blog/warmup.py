@@ -0,0 +1,51 @@
+import time
+
+from . import db
+
+
+def precompile_templates(app):
+    """Load every template so it is compiled (and bytecode-cached) now."""
+    names = [n for n in app.jinja_env.list_templates() if n.endswith((".html", ".txt", ".xml"))]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def prime_pool(app):
+    """Open up to `DB_POOL_SIZE` connections and return them to the pool."""
+    engine = db.engine
+    size = app.config["DB_POOL_SIZE"] if engine.dialect.name != "sqlite" else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(engine.connect())
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+
+def warm_up(app):
+    """Do the first-request work up front so a new worker starts out ready.
+
+    Compiles templates and opens pool connections; with `WARMUP_INDEXES`
+    also builds the in-process search and author indexes, whose cost grows
+    with the corpus. Returns a dict of what was done, for logging.
+    """
+    from .authors import ensure_author_index
+    from .utils import ensure_search_index
+
+    started = time.perf_counter()
+    with app.app_context():
+        templates = precompile_templates(app)
+        connections = prime_pool(app)
+        indexes = app.config["WARMUP_INDEXES"]
+        if indexes:
+            ensure_search_index(db.session)
+            ensure_author_index(db.session)
+    return {
+        "templates": templates,
+        "connections": connections,
+        "indexes": indexes,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,33 @@
+"""add indexes for hot query shapes
+
+Revision ID: 2eee59f93f4a
+Revises: 7b008561e79b
+Create Date: 2026-10-18 13:20:51.664082
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2eee59f93f4a'
+down_revision = '7b008561e79b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_post_published_created', 'post', ['is_published', 'date_created', 'id'])
+    op.create_index('ix_post_user_created', 'post', ['user_id', 'date_created', 'id'])
+    op.create_index('ix_comment_post_created', 'comment', ['post_id', 'date_created'])
+    op.create_index('ix_comment_parent_id', 'comment', ['parent_id'])
+    op.create_index('ix_comment_like_comment_id', 'comment_like', ['comment_id'])
+    op.create_index('ix_user_email', 'user', ['email'])
+
+
+def downgrade():
+    op.drop_index('ix_user_email', table_name='user')
+    op.drop_index('ix_comment_like_comment_id', table_name='comment_like')
+    op.drop_index('ix_comment_parent_id', table_name='comment')
+    op.drop_index('ix_comment_post_created', table_name='comment')
+    op.drop_index('ix_post_user_created', table_name='post')
+    op.drop_index('ix_post_published_created', table_name='post')
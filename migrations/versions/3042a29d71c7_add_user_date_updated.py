@@ -0,0 +1,28 @@
+"""add user.date_updated
+
+Revision ID: 3042a29d71c7
+Revises: ef204b6fc906
+Create Date: 2026-10-18 18:02:37.114208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3042a29d71c7'
+down_revision = 'ef204b6fc906'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('date_updated', sa.DateTime(), nullable=True))
+    op.create_index('ix_user_date_updated', 'user', ['date_updated'])
+
+
+def downgrade():
+    op.drop_index('ix_user_date_updated', table_name='user')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('date_updated')
@@ -0,0 +1,26 @@
+"""add post.activity
+
+Revision ID: 3be100f62214
+Revises: e96bce22532b
+Create Date: 2026-10-18 19:31:02.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3be100f62214'
+down_revision = 'e96bce22532b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('activity', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('activity')
@@ -0,0 +1,28 @@
+"""add post date_updated
+
+Revision ID: 6cfe93b9cab1
+Revises: 9ef113f69aa2
+Create Date: 2026-10-18 10:41:37.502114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6cfe93b9cab1'
+down_revision = '9ef113f69aa2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('date_updated', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE post SET date_updated = date_created")
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('date_updated')
@@ -0,0 +1,40 @@
+"""add post excerpt
+
+Revision ID: 7b008561e79b
+Revises: 6cfe93b9cab1
+Create Date: 2026-10-18 11:58:20.930417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b008561e79b'
+down_revision = '6cfe93b9cab1'
+branch_labels = None
+depends_on = None
+
+# keep in sync with blog.models.EXCERPT_LENGTH
+EXCERPT_LENGTH = 300
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('excerpt', sa.String(length=EXCERPT_LENGTH + 3), nullable=True))
+
+    post = sa.table('post', sa.column('content', sa.Text), sa.column('excerpt', sa.String))
+    # LENGTH counts bytes on MySQL/TiDB; CHAR_LENGTH matches Python's len()
+    length = sa.func.length if op.get_bind().dialect.name == 'sqlite' else sa.func.char_length
+    op.execute(
+        post.update().values(excerpt=sa.case(
+            (length(post.c.content) > EXCERPT_LENGTH,
+             sa.func.substr(post.c.content, 1, EXCERPT_LENGTH) + '...'),
+            else_=post.c.content,
+        ))
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('excerpt')
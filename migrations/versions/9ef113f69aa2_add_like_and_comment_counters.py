@@ -0,0 +1,42 @@
+"""add like and comment counters
+
+Revision ID: 9ef113f69aa2
+Revises: 3179a9aeb968
+Create Date: 2026-10-18 09:12:04.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9ef113f69aa2'
+down_revision = '3179a9aeb968'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from the existing rows
+    op.execute(
+        "UPDATE post SET comment_count = "
+        "(SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id)"
+    )
+    op.execute(
+        "UPDATE comment SET like_count = "
+        "(SELECT COUNT(*) FROM comment_like WHERE comment_like.comment_id = comment.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_column('like_count')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
@@ -0,0 +1,37 @@
+"""add related_post table
+
+Revision ID: d1051cb83181
+Revises: 5bf4b0f45f18
+Create Date: 2026-10-18 16:04:12.551903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1051cb83181'
+down_revision = '5bf4b0f45f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # app.py's development create_all() may have made it already
+    if sa.inspect(op.get_bind()).has_table('related_post'):
+        return
+    op.create_table('related_post',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.ForeignKeyConstraint(['related_id'], ['post.id'], ),
+    sa.PrimaryKeyConstraint('post_id', 'rank')
+    )
+    op.create_index('ix_related_post_related_id', 'related_post', ['related_id'])
+
+
+def downgrade():
+    op.drop_index('ix_related_post_related_id', table_name='related_post')
+    op.drop_table('related_post')
@@ -0,0 +1,23 @@
+"""add post (is_published, date_updated) index
+
+Revision ID: e96bce22532b
+Revises: 3042a29d71c7
+Create Date: 2026-10-18 19:12:44.530911
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e96bce22532b'
+down_revision = '3042a29d71c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_post_published_updated', 'post', ['is_published', 'date_updated'])
+
+
+def downgrade():
+    op.drop_index('ix_post_published_updated', table_name='post')
@@ -0,0 +1,72 @@
+"""remove orphaned comments and likes, recompute counters
+
+Revision ID: ef204b6fc906
+Revises: d1051cb83181
+Create Date: 2026-10-18 16:41:09.207733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ef204b6fc906'
+down_revision = 'd1051cb83181'
+branch_labels = None
+depends_on = None
+
+CHUNK = 500
+
+
+def _ids(bind, sql):
+    return [row[0] for row in bind.execute(sa.text(sql))]
+
+
+def _delete_comments(bind, ids):
+    # detach everything first so no parent goes before its replies
+    for i in range(0, len(ids), CHUNK):
+        chunk = ids[i:i + CHUNK]
+        bind.execute(sa.text("DELETE FROM comment_like WHERE comment_id IN :ids")
+                     .bindparams(sa.bindparam("ids", expanding=True)), {"ids": chunk})
+        bind.execute(sa.text("UPDATE comment SET parent_id = NULL WHERE id IN :ids")
+                     .bindparams(sa.bindparam("ids", expanding=True)), {"ids": chunk})
+    for i in range(0, len(ids), CHUNK):
+        bind.execute(sa.text("DELETE FROM comment WHERE id IN :ids")
+                     .bindparams(sa.bindparam("ids", expanding=True)), {"ids": ids[i:i + CHUNK]})
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # comments of posts that no longer exist
+    _delete_comments(bind, _ids(bind,
+        "SELECT c.id FROM comment c LEFT JOIN post p ON p.id = c.post_id WHERE p.id IS NULL"))
+
+    # replies whose parent was deleted on its own, and their replies in turn
+    while True:
+        orphans = _ids(bind,
+            "SELECT c.id FROM comment c LEFT JOIN comment parent ON parent.id = c.parent_id "
+            "WHERE c.parent_id IS NOT NULL AND parent.id IS NULL")
+        if not orphans:
+            break
+        _delete_comments(bind, orphans)
+
+    # likes of missing comments or users
+    for sql in (
+        "SELECT l.id FROM comment_like l LEFT JOIN comment c ON c.id = l.comment_id WHERE c.id IS NULL",
+        "SELECT l.id FROM comment_like l LEFT JOIN user u ON u.id = l.user_id WHERE u.id IS NULL",
+    ):
+        ids = _ids(bind, sql)
+        for i in range(0, len(ids), CHUNK):
+            bind.execute(sa.text("DELETE FROM comment_like WHERE id IN :ids")
+                         .bindparams(sa.bindparam("ids", expanding=True)), {"ids": ids[i:i + CHUNK]})
+
+    bind.execute(sa.text(
+        "UPDATE post SET comment_count = (SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id)"))
+    bind.execute(sa.text(
+        "UPDATE comment SET like_count = (SELECT COUNT(*) FROM comment_like WHERE comment_like.comment_id = comment.id)"))
+
+
+def downgrade():
+    # deleted orphans can't be restored; nothing to undo
+    pass